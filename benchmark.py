@@ -0,0 +1,191 @@
+import os
+import sys
+import csv
+import json
+import time
+import random
+import shutil
+import argparse
+import tracemalloc
+from llama_index.core import Settings
+from llama_index.core.node_parser import SentenceSplitter
+
+# Import local modules
+import index
+import query
+from src.embeddings import CachedEmbedding, EmbeddingCache
+from src.fakes import FakeLLM, FakeEmbedding
+from src.loader import CSV_COLUMNS
+from src.metrics import METRICS
+
+# Constants
+WORK_DIR = "./benchmark_runs"
+ROWS = 1000
+SEED = 42
+LLM_DELAY = 0.05       # Seconds per fake LLM request
+EMBED_DELAY = 0.005    # Seconds per fake encoder call
+QUERY_REPEATS = 1      # Times the query file is replayed (repeats exercise the query cache)
+
+TOPICS = ["人工智能", "机器学习", "历史", "哲学", "经济学", "心理学", "编程", "文学",
+          "科幻", "推理", "艺术", "教育", "医学", "物理", "旅行", "管理"]
+DEFAULT_QUERIES = [f"推荐一些关于{topic}的书籍" for topic in TOPICS]
+
+
+def make_synthetic_csv(path: str, rows: int, seed: int = SEED):
+    """Writes `rows` fake books whose summaries mix a few shared topics."""
+    rng = random.Random(seed)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for i in range(rows):
+            topics = rng.sample(TOPICS, 3)
+            summary = (f"本书讲述了{topics[0]}与{topics[1]}的关系，"
+                       f"并介绍了{topics[2]}领域的经典案例。" * rng.randint(1, 4))
+            writer.writerow([f"{i + 1:06d}", f"{topics[0]}之书{i + 1}", summary])
+
+
+def load_queries(path: str = None):
+    if path is None:
+        return list(DEFAULT_QUERIES)
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS, kilobytes on Linux
+    return peak / 2 ** 20 if sys.platform == "darwin" else peak / 2 ** 10
+
+
+def run_benchmark(
+    rows: int = ROWS,
+    queries_file: str = None,
+    llm_delay: float = LLM_DELAY,
+    embed_delay: float = EMBED_DELAY,
+    concurrency: int = index.MAX_CONCURRENT_REQUESTS,
+    repeats: int = QUERY_REPEATS,
+    use_cache: bool = False,
+    output: str = None
+) -> dict:
+    """
+    Builds an index from a synthetic CSV and replays a query file, with
+    FakeLLM / FakeEmbedding answering after a fixed delay, so throughput
+    and memory can be compared between commits without network access.
+    """
+    # 1. Fresh working directory & fake models (nothing is shared between runs)
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+    data_file = os.path.join(WORK_DIR, f"synthetic_{rows}.csv")
+    make_synthetic_csv(data_file, rows)
+    # Settings and module settings are restored afterwards, so the caller's
+    # models and later runs are left as they were (private attributes: the
+    # public getters would create default models for unset ones)
+    saved_settings = Settings._llm, Settings._embed_model, Settings._node_parser
+    Settings.llm = FakeLLM(delay=llm_delay)
+    Settings.embed_model = CachedEmbedding(
+        FakeEmbedding(delay=embed_delay),
+        EmbeddingCache(os.path.join(WORK_DIR, "embeddings.sqlite"))
+    )
+    # A new splitter: setting Settings.chunk_size would modify the caller's one
+    Settings.node_parser = SentenceSplitter(chunk_size=512)
+    storage_dir = os.path.join(WORK_DIR, "storage")
+    overrides = [
+        (index, "PERSIST_DIR", storage_dir),
+        (index, "DATA_FILE", data_file),
+        (query, "PERSIST_DIR", storage_dir),
+        (query, "QUERY_CACHE_SIZE", query.QUERY_CACHE_SIZE if use_cache else 0),
+        (query, "QUERY_CACHE_PATH", None),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in overrides]
+    for module, name, value in overrides:
+        setattr(module, name, value)
+    try:
+        METRICS.reset()
+        tracemalloc.start()
+
+        # 2. Build
+        print(f"\n=== BENCHMARK: building {rows} synthetic books ===")
+        start = time.perf_counter()
+        index.build_graph(full_rebuild=True, max_concurrency=concurrency, init_models=False)
+        build_seconds = time.perf_counter() - start
+        _, build_peak = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+
+        # 3. Replay queries
+        queries = load_queries(queries_file) * repeats
+        print(f"\n=== BENCHMARK: replaying {len(queries)} queries ===")
+        query_engine = query.load_query_engine(verbose=False)
+        start = time.perf_counter()
+        for text in queries:
+            with METRICS.timer("query.total"):
+                query_engine.query(text)
+        query_seconds = time.perf_counter() - start
+        _, query_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # 4. Report
+        results = {
+            "config": {"rows": rows, "queries": len(queries), "llm_delay": llm_delay,
+                       "embed_delay": embed_delay, "concurrency": concurrency, "query_cache": use_cache},
+            "build": {"seconds": build_seconds, "documents_per_second": rows / build_seconds,
+                      "peak_traced_mb": build_peak / 2 ** 20},
+            "query": {"seconds": query_seconds,
+                      "queries_per_second": len(queries) / query_seconds if query_seconds else 0.0,
+                      "peak_traced_mb": query_peak / 2 ** 20},
+            "peak_rss_mb": _peak_rss_mb(),
+            "llm_calls": Settings.llm.calls,
+            "metrics": METRICS.summary(),
+        }
+        print("\n=== BENCHMARK RESULTS ===")
+        print(f">> [BUILD] {rows} documents in {build_seconds:.2f}s "
+              f"({results['build']['documents_per_second']:.1f} docs/s, "
+              f"peak {results['build']['peak_traced_mb']:.1f} MB traced)")
+        print(f">> [QUERY] {len(queries)} queries in {query_seconds:.2f}s "
+              f"({results['query']['queries_per_second']:.1f} queries/s, "
+              f"peak {results['query']['peak_traced_mb']:.1f} MB traced)")
+        if results["peak_rss_mb"] is not None:
+            print(f">> [MEMORY] Peak RSS {results['peak_rss_mb']:.1f} MB")
+        if output:
+            with open(output, "w", encoding="utf-8") as f:
+                json.dump(results, f, ensure_ascii=False, indent=2)
+            print(f">> [METRICS] Results written to {output}")
+        return results
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
+        Settings._llm, Settings._embed_model, Settings._node_parser = saved_settings
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline build & query benchmark with fake models.")
+    parser.add_argument("--rows", type=int, default=ROWS, help="Number of synthetic books to index.")
+    parser.add_argument("--queries", default=None, metavar="FILE",
+                        help="Text file with one query per line (default: built-in topic queries).")
+    parser.add_argument("--llm-delay", type=float, default=LLM_DELAY,
+                        help="Seconds the fake LLM waits per request.")
+    parser.add_argument("--embed-delay", type=float, default=EMBED_DELAY,
+                        help="Seconds the fake embedding model waits per call.")
+    parser.add_argument("--concurrency", type=int, default=index.MAX_CONCURRENT_REQUESTS,
+                        help="Maximum number of extraction requests in flight.")
+    parser.add_argument("--repeats", type=int, default=QUERY_REPEATS,
+                        help="Number of times the query file is replayed.")
+    parser.add_argument("--cache", action="store_true", help="Enable the query cache.")
+    parser.add_argument("--output", default=None, metavar="PATH",
+                        help="Write results and per-stage metrics as JSON to PATH.")
+    args = parser.parse_args()
+    run_benchmark(
+        rows=args.rows,
+        queries_file=args.queries,
+        llm_delay=args.llm_delay,
+        embed_delay=args.embed_delay,
+        concurrency=args.concurrency,
+        repeats=args.repeats,
+        use_cache=args.cache,
+        output=args.output
+    )
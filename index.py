@@ -1,57 +1,393 @@
 import os
+import time
+import shutil
+import asyncio
+import argparse
+import numpy as np
 from dotenv import load_dotenv
 from llama_index.core import (
+    Settings,
     StorageContext,
-    KnowledgeGraphIndex
+    KnowledgeGraphIndex,
+    load_index_from_storage
 )
+from llama_index.core.graph_stores import SimpleGraphStore
 
 # Import local modules
 from src.config import init_settings
-from src.loader import load_documents_from_csv
+from src.loader import iter_documents_from_csv, iter_document_batches
+from src.manifest import BuildManifest
+from src.metrics import METRICS
+from src.embeddings import CachedEmbedding, EmbeddingCache
+from src.extraction import extract_triplets_concurrently
+from src.rate_limit import TokenBucket
+from src.graph_store import CompactGraphStore, has_compact_graph
+from src.graph_refine import (
+    MAX_NODE_DEGREE, BookNameResolver, degree_report, load_aliases, print_degree_report,
+    refine_graph, refine_inputs_changed, rewrite_generic, save_refine_inputs
+)
+from src.vector_index import VectorIndex, has_vector_index, saved_dtype
+from src.entity_match import EntityMatcher, has_entity_index
 from src.prompts import CUSTOM_KG_TRIPLET_EXTRACT_TMPL
 
 # Constants
 PERSIST_DIR = "./storage_graph_csv"
 DATA_FILE = "data/clean_data_100.csv"
+MAX_TRIPLETS_PER_CHUNK = 10
+BATCH_SIZE = 50  # Documents extracted per batch
+CHECKPOINT_INTERVAL = 60  # Minimum seconds between two checkpoints
+CHECKPOINT_MAX_OVERHEAD = 0.1  # Share of the build time checkpoints may take
+CHECKPOINT_TMP_DIR = "checkpoint.tmp"  # Checkpoints are written here, then moved into PERSIST_DIR
+MAX_CONCURRENT_REQUESTS = 8  # DeepSeek requests in flight during extraction
+REQUESTS_PER_MINUTE = None  # Optional API rate limits (None = unlimited)
+TOKENS_PER_MINUTE = None
+VECTOR_DTYPE = "float32"  # Triplet vector index precision: float32, float16 or int8
+VECTOR_CHUNK = 4096  # Triplets embedded (mostly cache hits) per call when saving the vector index
+
+INDEX_KWARGS = dict(
+    max_triplets_per_chunk=MAX_TRIPLETS_PER_CHUNK,
+    # Triplet vectors live in the embedding cache and vector_index/, not in
+    # index_store.json (hybrid search is done by src/retriever.py)
+    include_embeddings=False,
+    kg_triple_extract_template=CUSTOM_KG_TRIPLET_EXTRACT_TMPL,
+    show_progress=True
+)
+
+
+def _open_index(manifest, removed_triplets):
+    """
+    Opens the persisted index without the triplets in `removed_triplets`,
+    or creates an empty one when there is nothing to resume from.
+    """
+    has_index = os.path.exists(os.path.join(PERSIST_DIR, "index_store.json"))
+    if len(manifest) == 0 or not has_index:
+        storage_context = StorageContext.from_defaults()
+        return KnowledgeGraphIndex(nodes=[], storage_context=storage_context, **INDEX_KWARGS)
+
+    # SimpleGraphStore.delete() cannot remove pairs loaded from JSON,
+    # so we prune the raw graph_dict before handing it to the index.
+    graph_dict = SimpleGraphStore.from_persist_dir(PERSIST_DIR).to_dict()["graph_dict"]
+    for subj, rel, obj in removed_triplets:
+        edges = graph_dict.get(subj, [])
+        if [rel, obj] in edges:
+            edges.remove([rel, obj])
+            if not edges:
+                del graph_dict[subj]
+
+    storage_context = StorageContext.from_defaults(
+        persist_dir=PERSIST_DIR,
+        graph_store=SimpleGraphStore.from_dict({"graph_dict": graph_dict})
+    )
+    index = load_index_from_storage(storage_context, **INDEX_KWARGS)
+    _migrate_embedding_dict(index)
+    return index
+
+
+def _migrate_embedding_dict(index):
+    """
+    Older builds kept every triplet vector in index_store.json. They are
+    moved into the embedding cache (when there is one) and dropped from
+    the index struct, so the next checkpoint writes a small index store.
+    """
+    embedding_dict = index.index_struct.embedding_dict
+    if not embedding_dict:
+        return
+    embed_model = Settings.embed_model
+    if isinstance(embed_model, CachedEmbedding):
+        embed_model.cache.put_many({
+            EmbeddingCache.make_key(embed_model.model_name, "text", text): embedding
+            for text, embedding in embedding_dict.items()
+        })
+    print(f">> [BUILD] Moved {len(embedding_dict)} triplet embeddings out of index_store.json.")
+    embedding_dict.clear()
+
+
+def _purge_documents(index, doc_ids):
+    """Removes the chunks of the given documents from the docstore and keyword table."""
+    node_ids = set()
+    for doc_id in doc_ids:
+        ref_doc_info = index.docstore.get_ref_doc_info(doc_id)
+        if ref_doc_info is not None:
+            node_ids.update(ref_doc_info.node_ids)
+            index.docstore.delete_ref_doc(doc_id, raise_error=False)
+
+    if not node_ids:
+        return
+    table = index.index_struct.table
+    for keyword in list(table):
+        table[keyword] -= node_ids
+        if not table[keyword]:
+            del table[keyword]
+
+
+def _index_batch(index, manifest, documents, max_concurrency, request_bucket, token_bucket, loop):
+    """
+    Extracts the triplets of a batch of documents concurrently, then writes
+    them into the graph in document order so the result is deterministic.
+    Documents with a chunk that kept failing are left out of the manifest
+    and will be retried on the next run.
+    """
+    with METRICS.timer("build.chunking"):
+        doc_nodes = [Settings.node_parser.get_nodes_from_documents([doc]) for doc in documents]
+    all_nodes = [node for nodes in doc_nodes for node in nodes]
+    with METRICS.timer("build.extract"):
+        results, _ = extract_triplets_concurrently(
+            all_nodes,
+            index.kg_triplet_extract_template,
+            max_concurrency=max_concurrency,
+            request_bucket=request_bucket,
+            token_bucket=token_bucket,
+            loop=loop
+        )
+
+    upsert_start = time.perf_counter()
+    batch_texts = {}
+    position = 0
+    for doc, nodes in zip(documents, doc_nodes):
+        node_results = results[position:position + len(nodes)]
+        position += len(nodes)
+        if any(triplets is None for triplets in node_results):
+            print(f">> [BUILD] Skipping {doc.doc_id}, it will be retried on the next run.")
+            continue
+
+        doc_triplets = []
+        for node, triplets in zip(nodes, node_results):
+            # "本书" -> the book's title, so summaries don't all share one hub subject
+            triplets = [rewrite_generic(t, doc.metadata.get("book_name")) for t in triplets]
+            for triplet in triplets:
+                index.upsert_triplet_and_node(triplet, node)
+                batch_texts[str(triplet)] = None
+            doc_triplets.extend(triplets)
+        manifest.record(doc.doc_id, doc.hash, doc_triplets)
+        METRICS.count("build.documents")
+        METRICS.count("build.triplets", len(doc_triplets))
+    METRICS.record_time("build.upsert", time.perf_counter() - upsert_start)
+
+    # Embed the triplets of the batch in a single call. The vectors are kept
+    # by the embedding cache only, _save_query_stores reads them back from it.
+    if batch_texts:
+        texts = list(batch_texts)
+        METRICS.observe("build.embed_batch_size", len(texts))
+        with METRICS.timer("build.embed"):
+            Settings.embed_model.get_text_embedding_batch(texts)
+
+
+def _checkpoint(index, manifest):
+    """
+    Persists the index first, then the manifest that describes it. Returns the seconds spent.
+
+    StorageContext.persist() rewrites its JSON files in place, so it writes
+    into CHECKPOINT_TMP_DIR and every complete file is moved over the previous
+    one with os.replace: a crash never leaves a truncated docstore.json or
+    graph_store.json behind. index_store.json, which _open_index looks for, goes last.
+    """
+    start = time.perf_counter()
+    tmp_dir = os.path.join(PERSIST_DIR, CHECKPOINT_TMP_DIR)
+    with METRICS.timer("build.checkpoint"):
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        index.storage_context.index_store.add_index_struct(index.index_struct)
+        index.storage_context.persist(persist_dir=tmp_dir)
+        for file_name in sorted(os.listdir(tmp_dir), key=lambda name: name == "index_store.json"):
+            os.replace(os.path.join(tmp_dir, file_name), os.path.join(PERSIST_DIR, file_name))
+        os.rmdir(tmp_dir)
+        manifest.save()
+    return time.perf_counter() - start
+
+
+def _save_query_stores(index, manifest, vector_dtype, max_degree):
+    """
+    Writes the memory-mapped graph, vector index and entity index used by query.py.
+    The query graph is refined first (generic subjects, aliases, degree cap),
+    graph_store.json keeps every extracted triplet for incremental builds.
+    """
+    with METRICS.timer("build.query_stores"):
+        graph_dict = index.graph_store.to_dict()["graph_dict"]
+        resolver = BookNameResolver(index.docstore, index.index_struct.table, manifest.documents)
+        refined, stats = refine_graph(graph_dict, resolver, load_aliases(PERSIST_DIR), max_degree)
+        print_degree_report(degree_report(graph_dict), degree_report(refined))
+        print(f">> [GRAPH] Refinement: {stats}")
+        CompactGraphStore.from_graph_dict(refined).save(PERSIST_DIR)
+        EntityMatcher.from_graph_dict(refined).save(PERSIST_DIR)
+        # Same triplets as the query graph: no unmerged aliases, "本书" edges or pruned edges
+        _triplet_vector_index(refined, vector_dtype).save(PERSIST_DIR)
+        save_refine_inputs(PERSIST_DIR, max_degree)
+
+
+def _triplet_vector_index(graph_dict, vector_dtype):
+    """
+    Vector index over the triplets of a graph_dict, keyed by str(triplet)
+    like KGTableRetriever. The vectors come from the embedding cache (filled
+    by _index_batch), only triplets missing from it (e.g. merged names) are encoded.
+    """
+    ids = [str((subj, rel, obj)) for subj, edges in graph_dict.items() for rel, obj in edges]
+    with METRICS.timer("build.vector_index"):
+        blocks = [
+            np.asarray(Settings.embed_model.get_text_embedding_batch(ids[start:start + VECTOR_CHUNK]),
+                       dtype=np.float32)
+            for start in range(0, len(ids), VECTOR_CHUNK)
+        ]
+        matrix = np.vstack(blocks) if blocks else np.zeros((0, 0), dtype=np.float32)
+        return VectorIndex.from_embeddings(ids, matrix, dtype=vector_dtype)
+
+
+def _finish_metrics(start, metrics_path):
+    METRICS.record_time("build.total", time.perf_counter() - start)
+    METRICS.report()
+    if metrics_path:
+        METRICS.export(metrics_path)
+        print(f">> [METRICS] Stage timings written to {metrics_path}")
+
+
+def build_graph(
+    full_rebuild: bool = False,
+    batch_size: int = BATCH_SIZE,
+    checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    max_concurrency: int = MAX_CONCURRENT_REQUESTS,
+    requests_per_minute: float = REQUESTS_PER_MINUTE,
+    tokens_per_minute: float = TOKENS_PER_MINUTE,
+    vector_dtype: str = VECTOR_DTYPE,
+    max_degree: int = MAX_NODE_DEGREE,
+    metrics_path: str = None,
+    init_models: bool = True
+):
+    """
+    Builds or incrementally updates the index in PERSIST_DIR from DATA_FILE.
+    Pass init_models=False to keep the models already set on Settings
+    (e.g. the fakes used by benchmark.py).
+    """
+    start = time.perf_counter()
 
-def build_graph():
     # 1. Load Environment Variables
     load_dotenv()
     api_key = os.getenv("DEEPSEEK_API_KEY")
-    
+
     # 2. Initialize Models
-    init_settings(api_key)
+    if init_models:
+        with METRICS.timer("build.load_models"):
+            init_settings(api_key)
 
     print(f"\n=== STARTING INDEXATION PROCESS ===")
-    
+
     # 3. Load Data
     if not os.path.exists(DATA_FILE):
         print(f"[ERROR] Data file not found at: {DATA_FILE}")
         return
 
-    documents = load_documents_from_csv(DATA_FILE)
+    # 4. Compare with the previous build (first streaming pass, hashes only)
+    # Rows whose content hash is unchanged are skipped entirely (no DeepSeek call).
+    manifest = BuildManifest(PERSIST_DIR) if full_rebuild else BuildManifest.load(PERSIST_DIR)
+    if not full_rebuild and len(manifest) == 0:
+        print(">> [BUILD] No previous build manifest found, running a full build.")
+
+    current_ids = set()
+    pending_ids = set()
+    with METRICS.timer("build.scan_csv"):
+        for doc in iter_documents_from_csv(DATA_FILE):
+            current_ids.add(doc.doc_id)
+            if not manifest.is_current(doc.doc_id, doc.hash):
+                pending_ids.add(doc.doc_id)
+
+    deleted_ids = [doc_id for doc_id in manifest.documents if doc_id not in current_ids]
+    stale_ids = deleted_ids + [doc_id for doc_id in pending_ids if doc_id in manifest.documents]
+    print(f">> [BUILD] {len(pending_ids)} new/changed, {len(deleted_ids)} deleted, "
+          f"{len(current_ids) - len(pending_ids)} unchanged documents.")
+
+    if not pending_ids and not deleted_ids:
+        stores = [has_compact_graph(PERSIST_DIR), has_vector_index(PERSIST_DIR), has_entity_index(PERSIST_DIR)]
+        # A different --vector-dtype, --max-degree or entity_aliases.json only
+        # needs the query stores rebuilt, not a new extraction
+        if (not all(stores) or saved_dtype(PERSIST_DIR) != vector_dtype
+                or refine_inputs_changed(PERSIST_DIR, max_degree)):
+            _save_query_stores(_open_index(manifest, set()), manifest, vector_dtype, max_degree)
+            print(">> [SAVE] Query stores generated from the existing index.")
+        print("=== INDEX ALREADY UP TO DATE ===")
+        _finish_metrics(start, metrics_path)
+        return
+
+    # Triplets are only dropped once no remaining document still produces them
+    removed_triplets = set()
+    for doc_id in stale_ids:
+        removed_triplets.update(manifest.forget(doc_id))
+    removed_triplets -= manifest.referenced_triplets()
+
+    with METRICS.timer("build.open_index"):
+        index = _open_index(manifest, removed_triplets)
+    # Pending documents are purged too: a crash after a checkpoint of the
+    # index but before the manifest was saved may have left their chunks behind.
+    _purge_documents(index, stale_ids + list(pending_ids))
 
-    # 4. Build Graph (Calls DeepSeek API)
+    # 5. Extract triplets for new/changed documents (Calls DeepSeek API)
     print("\n>> [BUILD] Calling DeepSeek to extract relationships (Please wait)...")
-    
-    storage_context = StorageContext.from_defaults()
-    
-    index = KnowledgeGraphIndex.from_documents(
-        documents,
-        storage_context=storage_context,
-        max_triplets_per_chunk=10, 
-        include_embeddings=True, # Enable Hybrid Search (Vector + Graph)
-        kg_triple_extract_template=CUSTOM_KG_TRIPLET_EXTRACT_TMPL,
-        show_progress=True
+    # Second streaming pass: pending documents go straight into extraction
+    pending = (
+        doc for doc in iter_documents_from_csv(DATA_FILE, verbose=False)
+        if doc.doc_id in pending_ids
     )
+    # A checkpoint rewrites the whole docstore, index store and manifest, so its
+    # cost grows with the index: checkpoints are spaced by time, and further apart
+    # as they get slower, instead of following every batch.
+    # Rate limits are shared by all batches, each batch must not start a full bucket
+    request_bucket = TokenBucket(requests_per_minute) if requests_per_minute else None
+    token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+    done = 0
+    last_checkpoint = time.monotonic()
+    checkpoint_seconds = 0.0
+    # One event loop for the whole build: the LLM client's pooled connections
+    # are bound to the loop that opened them
+    loop = asyncio.new_event_loop()
+    try:
+        for batch in iter_document_batches(pending, batch_size):
+            _index_batch(index, manifest, batch, max_concurrency, request_bucket, token_bucket, loop)
+            done += len(batch)
+            # 0 checkpoints after every batch, whatever a checkpoint costs
+            min_gap = checkpoint_interval and max(checkpoint_interval, checkpoint_seconds / CHECKPOINT_MAX_OVERHEAD)
+            if time.monotonic() - last_checkpoint >= min_gap:
+                checkpoint_seconds = _checkpoint(index, manifest)
+                last_checkpoint = time.monotonic()
+                print(f">> [CHECKPOINT] {done}/{len(pending_ids)} documents saved.")
+    finally:
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
 
-    # 5. Save to Disk
+    # 6. Save to Disk
     print(f"\n>> [SAVE] Persisting index to folder '{PERSIST_DIR}'...")
     if not os.path.exists(PERSIST_DIR):
         os.makedirs(PERSIST_DIR)
-        
-    index.storage_context.persist(persist_dir=PERSIST_DIR)
+
+    _checkpoint(index, manifest)
+    _save_query_stores(index, manifest, vector_dtype, max_degree)
     print("=== INDEXATION COMPLETED SUCCESSFULLY ===")
+    _finish_metrics(start, metrics_path)
 
 if __name__ == "__main__":
-    build_graph()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build the book knowledge graph.")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the previous build and re-extract every document.")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE,
+                        help="Number of documents extracted per batch.")
+    parser.add_argument("--checkpoint-interval", type=float, default=CHECKPOINT_INTERVAL,
+                        help="Minimum seconds between two checkpoints (0 = after every batch).")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENT_REQUESTS,
+                        help="Maximum number of extraction requests in flight.")
+    parser.add_argument("--rpm", type=float, default=REQUESTS_PER_MINUTE,
+                        help="Maximum extraction requests per minute.")
+    parser.add_argument("--tpm", type=float, default=TOKENS_PER_MINUTE,
+                        help="Maximum (estimated) tokens per minute.")
+    parser.add_argument("--vector-dtype", choices=["float32", "float16", "int8"], default=VECTOR_DTYPE,
+                        help="Precision of the saved triplet vector index.")
+    parser.add_argument("--max-degree", type=int, default=MAX_NODE_DEGREE,
+                        help="Outgoing edges kept per entity in the query graph (0 = no cap).")
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="Write per-stage timings and counters as JSON to PATH.")
+    args = parser.parse_args()
+    build_graph(
+        full_rebuild=args.full,
+        batch_size=args.batch_size,
+        checkpoint_interval=args.checkpoint_interval,
+        max_concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        vector_dtype=args.vector_dtype,
+        max_degree=args.max_degree,
+        metrics_path=args.metrics
+    )
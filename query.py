@@ -1,58 +1,159 @@
 import os
 import sys
+import json
+import codecs
+import argparse
+import urllib.request
 from dotenv import load_dotenv
 from llama_index.core import (
     StorageContext,
     load_index_from_storage
 )
+from llama_index.core.indices.knowledge_graph.retrievers import KGRetrieverMode
+from llama_index.core.response_synthesizers import get_response_synthesizer
 
 # Import local modules
+from src.cache import CachedQueryEngine, QueryCache
 from src.config import init_settings
+from src.context_packer import ContextPacker
+from src.metrics import METRICS
+from src.graph_store import CompactGraphStore, has_compact_graph
+from src.entity_match import EntityMatcher, has_entity_index
+from src.retriever import GraphRetriever
+from src.vector_index import VectorIndex, has_vector_index
 # Note: This imports the prompt we defined in src/prompts.py
 # (which might be the Chinese one or English one depending on your last edit)
 from src.prompts import CUSTOM_CHAT_PROMPT
 
 # Directory where the database is stored
 PERSIST_DIR = "./storage_graph_csv"
+# "entity": match graph entities in the query locally (no LLM call)
+# "llm": ask DeepSeek to extract the query keywords first
+KEYWORD_MODE = "entity"
+# "keyword": graph retrieval from the query keywords only (no query embedding)
+# "hybrid": also adds the triplets closest to the query embedding (one BGE-M3
+#           encode per uncached query, results deduplicated and capped)
+RETRIEVER_MODE = "keyword"
+# Graph paths expanded per query over all keywords (None = 30 per keyword, no total)
+MAX_QUERY_EDGES = 60
+# Retrieved chunks and triplets are packed per book into this many (estimated)
+# tokens before synthesis; None sends them to DeepSeek as retrieved
+CONTEXT_TOKEN_BUDGET = 2000
+SUMMARY_TOKEN_BUDGET = 250      # Summary text kept per book
+# Repeated queries are answered from a two-level cache (see src/cache.py)
+QUERY_CACHE_SIZE = 1024         # Entries per cache level, 0 disables the cache
+QUERY_CACHE_TTL = 3600          # Seconds before a cached answer expires
+QUERY_CACHE_PATH = "./cache/query_cache.sqlite"  # None keeps the cache in memory only
 
-def start_chat():
-    # 1. Load Environment Variables & API Key
-    load_dotenv()
-    api_key = os.getenv("DEEPSEEK_API_KEY")
-    
-    # 2. Initialize Models (DeepSeek + BGE-M3)
-    try:
-        init_settings(api_key)
-    except Exception as e:
-        print(f"[ERROR] Configuration failed: {e}")
-        return
-
-    # 3. Check if the database exists
+def load_query_engine(streaming: bool = False, verbose: bool = True):
+    """
+    Loads the persisted index and builds the query engine.
+    Models must already be initialized (see src/config.py).
+    Returns None if the index cannot be loaded.
+    """
+    # 1. Check if the database exists
     if not os.path.exists(PERSIST_DIR):
         print(f"\n[ERROR] The folder '{PERSIST_DIR}' does not exist.")
         print(">> Please run 'python index.py' first to build the database.")
-        return
+        return None
 
     print(f"\n>> [SYSTEM] Loading graph from disk '{PERSIST_DIR}'...")
     try:
-        storage_context = StorageContext.from_defaults(persist_dir=PERSIST_DIR)
-        index = load_index_from_storage(storage_context)
+        # The compact store is memory-mapped, so graph_store.json is not parsed;
+        # docstore.json and index_store.json are still loaded in full.
+        with METRICS.timer("query.load_index"):
+            graph_store = None
+            if has_compact_graph(PERSIST_DIR):
+                graph_store = CompactGraphStore.from_persist_dir(PERSIST_DIR)
+            storage_context = StorageContext.from_defaults(
+                persist_dir=PERSIST_DIR,
+                graph_store=graph_store
+            )
+            index = load_index_from_storage(storage_context)
     except Exception as e:
         print(f"[ERROR] Could not load index: {e}")
-        return
+        return None
 
-    # 4. Create Query Engine
-    # We use 'compact' mode to pass retrieved context directly to the LLM
-    # adhering strictly to the 'Role' defined in src/prompts.py
-    query_engine = index.as_query_engine(
+    # 2. Create Query Engine
+    # Triplet embeddings are searched through the memory-mapped vector index
+    retriever_mode = KGRetrieverMode(RETRIEVER_MODE)
+    vector_index = None
+    if retriever_mode != KGRetrieverMode.KEYWORD and has_vector_index(PERSIST_DIR):
+        vector_index = VectorIndex.load(PERSIST_DIR)
+    entity_matcher = None
+    if KEYWORD_MODE == "entity" and has_entity_index(PERSIST_DIR):
+        entity_matcher = EntityMatcher.load(PERSIST_DIR)
+    elif KEYWORD_MODE == "entity":
+        print(">> [SYSTEM] No entity index found (run 'python index.py' to generate it), "
+              "falling back to LLM keyword extraction.")
+    retriever = GraphRetriever(
+        index,
+        vector_index=vector_index,
+        entity_matcher=entity_matcher,
+        max_query_edges=MAX_QUERY_EDGES,
+        retriever_mode=retriever_mode,
         include_text=True,
-        response_mode="compact",  
         similarity_top_k=5,       # Retrieve top 5 matches
-        text_qa_template=CUSTOM_CHAT_PROMPT, # Apply strict prompt rules
-        verbose=True              # Show internal reasoning in console
+        verbose=verbose           # Show internal reasoning in console
+    )
+    # We use 'compact' mode to pass retrieved context directly to the LLM
+    # adhering strictly to the 'Role' defined in src/prompts.py
+    synthesizer = get_response_synthesizer(
+        response_mode="compact",
+        text_qa_template=CUSTOM_CHAT_PROMPT,     # Apply strict prompt rules
+        streaming=streaming,
+        verbose=verbose
     )
+    cache = None
+    if QUERY_CACHE_SIZE:
+        cache = QueryCache(PERSIST_DIR, max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL,
+                           disk_path=QUERY_CACHE_PATH)
+    postprocessors = []
+    if CONTEXT_TOKEN_BUDGET:
+        postprocessors.append(ContextPacker(
+            max_context_tokens=CONTEXT_TOKEN_BUDGET,
+            max_summary_tokens=SUMMARY_TOKEN_BUDGET,
+            verbose=verbose
+        ))
+    return CachedQueryEngine(retriever, synthesizer, CUSTOM_CHAT_PROMPT, cache,
+                             node_postprocessors=postprocessors)
 
-    # 5. Chat Loop
+def ask_server(server_url: str, query: str):
+    """Sends a query to server.py and prints the answer as it is streamed back."""
+    request = urllib.request.Request(
+        f"{server_url.rstrip('/')}/query",
+        data=json.dumps({"query": query, "stream": True}).encode("utf-8"),
+        headers={"Content-Type": "application/json"}
+    )
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    with urllib.request.urlopen(request) as response:
+        for chunk in iter(lambda: response.read1(1024), b""):
+            print(decoder.decode(chunk), end="", flush=True)
+    print()
+
+def start_chat(server_url: str = None, metrics_path: str = None):
+    query_engine = None
+    if server_url is None:
+        # 1. Load Environment Variables & API Key
+        load_dotenv()
+        api_key = os.getenv("DEEPSEEK_API_KEY")
+
+        # 2. Initialize Models (DeepSeek + BGE-M3)
+        try:
+            with METRICS.timer("query.load_models"):
+                init_settings(api_key)
+        except Exception as e:
+            print(f"[ERROR] Configuration failed: {e}")
+            return
+
+        # 3. Load the index & query engine
+        query_engine = load_query_engine()
+        if query_engine is None:
+            return
+    else:
+        print(f">> [SYSTEM] Using query server at {server_url}")
+
+    # 4. Chat Loop
     print("\n" + "="*40)
     print("  BOOK RECOMMENDATION SYSTEM")
     print("  Type 'exit', 'quit' or 'q' to stop.")
@@ -61,20 +162,35 @@ def start_chat():
     while True:
         user_input = input("Your Query: ")
         if user_input.lower() in ["exit", "quit", "q"]:
+            if metrics_path:
+                METRICS.export(metrics_path)
+                print(f">> [METRICS] Stage timings written to {metrics_path}")
             print("Goodbye!")
             break
-        
+
         if not user_input.strip():
             continue
 
         print("\n[AI] Thinking...\n")
         try:
-            response = query_engine.query(user_input)
-            # Display Final Response
-            print(f"RESPONSE:\n{response}\n")
+            if server_url is not None:
+                print("RESPONSE:")
+                ask_server(server_url, user_input)
+            else:
+                with METRICS.timer("query.total"):
+                    response = query_engine.query(user_input)
+                # Display Final Response
+                print(f"RESPONSE:\n{response}\n")
             print("-" * 40)
         except Exception as e:
             print(f"Error during query: {e}")
 
 if __name__ == "__main__":
-    start_chat()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Interactive book recommendation chat.")
+    parser.add_argument("--server", default=None,
+                        help="URL of a running server.py (e.g. http://127.0.0.1:8000); "
+                             "without it the index is loaded in this process.")
+    parser.add_argument("--metrics", default=None, metavar="PATH",
+                        help="Write per-stage timings and counters as JSON to PATH on exit.")
+    args = parser.parse_args()
+    start_chat(server_url=args.server, metrics_path=args.metrics)
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from llama_index.core import Settings
+
+# Import local modules
+from src.config import init_settings
+from src.embeddings import CachedEmbedding
+from src.fakes import FakeLLM
+from src.metrics import METRICS
+from query import load_query_engine
+
+# Constants
+HOST = "127.0.0.1"
+PORT = 8000
+MAX_IN_FLIGHT = 16            # Queries processed at the same time, extra ones get a 503
+EMBED_BATCH_WINDOW = 0.005    # Seconds to wait for more queries before embedding a batch
+EMBED_MAX_BATCH = 32
+
+_DONE = object()
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+
+class QueryEmbeddingBatcher:
+    """
+    Collects the query embeddings requested by concurrent queries during
+    a short window and encodes them in a single call to the embed model.
+    A CachedEmbedding is unwrapped: query texts must not grow the
+    on-disk triplet embedding cache.
+    """
+
+    def __init__(self, embed_model, max_batch_size: int = EMBED_MAX_BATCH,
+                 window: float = EMBED_BATCH_WINDOW):
+        if isinstance(embed_model, CachedEmbedding):
+            embed_model = embed_model.model
+        self._embed_model = embed_model
+        self._max_batch_size = max_batch_size
+        self._window = window
+        self._pending = []
+        self._timer = None
+        self.batch_sizes = []
+
+    async def embed(self, text: str):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self._window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        texts = [text for text, _ in batch]
+        self.batch_sizes.append(len(texts))
+        METRICS.observe("server.embed_batch_size", len(texts))
+        loop = asyncio.get_running_loop()
+        try:
+            # BGE-M3 encodes queries and documents the same way
+            vectors = await loop.run_in_executor(
+                None, self._embed_model.get_text_embedding_batch, texts
+            )
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+
+class QueryServer:
+    """
+    Minimal asyncio HTTP server around one warm, streaming query engine.
+
+    GET  /health  -> JSON status
+    GET  /metrics -> per-stage timings and counters (see src/metrics.py)
+    POST /query   {"query": "...", "stream": true} -> answer tokens as a
+                  chunked text/plain stream (or JSON when stream is false)
+    """
+
+    def __init__(self, query_engine, embed_model, max_in_flight: int = MAX_IN_FLIGHT):
+        self.query_engine = query_engine
+        self.batcher = QueryEmbeddingBatcher(embed_model)
+        self._loop = None
+        # Queries are embedded lazily by the retriever, on a retrieval cache miss only
+        retriever = getattr(query_engine, "retriever", None)
+        if hasattr(retriever, "query_embedder"):
+            retriever.query_embedder = self._embed_from_thread
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.served = 0
+        self.rejected = 0
+        self.started = time.time()
+
+    async def serve(self, host: str = HOST, port: int = PORT):
+        loop = self._loop = asyncio.get_running_loop()
+        # Retrieval and the LLM stream run in threads, one or two per query
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=2 * self.max_in_flight + 4))
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f">> [SERVER] Listening on http://{host}:{port} (max {self.max_in_flight} queries in flight)")
+        async with server:
+            await server.serve_forever()
+
+    # ------------------------------------------------------------------
+    # HTTP plumbing
+    # ------------------------------------------------------------------
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, path, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+            if method == "GET" and path == "/health":
+                await self._send_json(writer, 200, self.health())
+            elif method == "GET" and path == "/metrics":
+                await self._send_json(writer, 200, METRICS.summary())
+            elif method == "POST" and path == "/query":
+                await self._handle_query(writer, body)
+            else:
+                await self._send_json(writer, 404, {"error": f"No route for {method} {path}"})
+        except (ValueError, asyncio.IncompleteReadError):
+            await self._send_json(writer, 400, {"error": "Malformed request"})
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _write_head(self, writer, status: int, content_type: str, length: int = None):
+        lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+                 f"Content-Type: {content_type}",
+                 "Connection: close"]
+        lines.append(f"Content-Length: {length}" if length is not None else "Transfer-Encoding: chunked")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    async def _send_json(self, writer, status: int, payload: dict):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._write_head(writer, status, "application/json; charset=utf-8", len(body))
+        writer.write(body)
+        await writer.drain()
+
+    async def _send_chunk(self, writer, text: str):
+        data = text.encode("utf-8")
+        if data:
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+    def health(self) -> dict:
+        batches = self.batcher.batch_sizes
+        cache = getattr(self.query_engine, "cache", None)
+        return {
+            "status": "ok",
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "served": self.served,
+            "rejected": self.rejected,
+            "embedding_batches": len(batches),
+            "avg_embedding_batch": sum(batches) / len(batches) if batches else 0.0,
+            "uptime_seconds": round(time.time() - self.started, 1),
+            "cache": cache.stats() if cache is not None else None,
+        }
+
+    async def _handle_query(self, writer, body: bytes):
+        payload = json.loads(body or b"{}")
+        query = str(payload.get("query", "")).strip()
+        if not query:
+            await self._send_json(writer, 400, {"error": "Field 'query' is required"})
+            return
+        if self.in_flight >= self.max_in_flight:
+            self.rejected += 1
+            await self._send_json(writer, 503, {"error": "Too many queries in flight, retry later"})
+            return
+
+        self.in_flight += 1
+        try:
+            tokens = self.answer(query)
+            if payload.get("stream", True):
+                self._write_head(writer, 200, "text/plain; charset=utf-8")
+                try:
+                    async for token in tokens:
+                        await self._send_chunk(writer, token)
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    await self._send_chunk(writer, f"\n[ERROR] {e}")
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+            else:
+                try:
+                    answer = "".join([token async for token in tokens])
+                except Exception as e:
+                    await self._send_json(writer, 500, {"error": str(e)})
+                    return
+                await self._send_json(writer, 200, {"query": query, "response": answer})
+            self.served += 1
+        finally:
+            self.in_flight -= 1
+
+    def _embed_from_thread(self, text: str):
+        """Called by the retriever in an executor thread, batched on the server loop."""
+        return asyncio.run_coroutine_threadsafe(self.batcher.embed(text), self._loop).result()
+
+    async def answer(self, query: str):
+        """Yields the answer tokens of one query as the LLM produces them."""
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        # Cached queries are answered without embedding the query at all
+        response = await loop.run_in_executor(None, self.query_engine.query, query)
+
+        response_gen = getattr(response, "response_gen", None)
+        if response_gen is None:
+            # e.g. nothing retrieved or a cached answer: a plain Response
+            METRICS.record_time("server.first_token", time.perf_counter() - start)
+            yield str(response)
+        else:
+            first = True
+            while True:
+                token = await loop.run_in_executor(None, next, response_gen, _DONE)
+                if token is _DONE:
+                    break
+                if first:
+                    METRICS.record_time("server.first_token", time.perf_counter() - start)
+                    first = False
+                yield token
+        METRICS.record_time("server.query", time.perf_counter() - start)
+
+
+def start_server(host: str = HOST, port: int = PORT, max_in_flight: int = MAX_IN_FLIGHT,
+                 fake_llm_delay: float = None):
+    # 1. Load Environment Variables & Initialize Models (once, kept warm)
+    load_dotenv()
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    try:
+        init_settings(api_key or ("fake" if fake_llm_delay is not None else None))
+    except Exception as e:
+        print(f"[ERROR] Configuration failed: {e}")
+        return
+    if fake_llm_delay is not None:
+        print(f">> [SERVER] Using FakeLLM ({fake_llm_delay}s per request) instead of DeepSeek.")
+        Settings.llm = FakeLLM(delay=fake_llm_delay, token_delay=0.01)
+
+    # 2. Load the index once
+    query_engine = load_query_engine(streaming=True, verbose=False)
+    if query_engine is None:
+        return
+
+    # 3. Serve
+    server = QueryServer(query_engine, Settings.embed_model, max_in_flight=max_in_flight)
+    try:
+        asyncio.run(server.serve(host, port))
+    except KeyboardInterrupt:
+        print("\n>> [SERVER] Stopped.")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Book recommendation query server.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT,
+                        help="Maximum number of queries processed concurrently.")
+    parser.add_argument("--fake-llm", type=float, default=None, metavar="DELAY",
+                        help="Answer with a local FakeLLM that waits DELAY seconds (for testing).")
+    args = parser.parse_args()
+    start_server(args.host, args.port, args.max_in_flight, args.fake_llm)
@@ -0,0 +1,68 @@
+import os
+import json
+import time
+
+import numpy as np
+
+META_FILE = "meta.json"
+
+
+def save_arrays(path: str, arrays: dict, meta: dict):
+    """
+    Saves NumPy arrays plus a meta.json describing them under `path`.
+
+    Files are never rewritten in place: each save writes a new generation
+    of .npy files, then switches meta.json to it with one os.replace.
+    Processes that memory-mapped the previous generation keep reading
+    their (unlinked) files, and a reader always sees a meta.json that
+    matches the arrays it names.
+    """
+    os.makedirs(path, exist_ok=True)
+    generation = f"{time.time_ns():x}"
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.{generation}.npy"), np.asarray(array))
+
+    tmp_path = os.path.join(path, META_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(dict(meta, generation=generation, arrays=list(arrays)), f, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(path, META_FILE))
+
+    # Older generations: still-mapped files stay readable until unmapped
+    # (on Windows a mapped file cannot be removed, it goes on the next save)
+    for file_name in os.listdir(path):
+        if file_name.endswith(".npy") and not file_name.endswith(f".{generation}.npy"):
+            try:
+                os.remove(os.path.join(path, file_name))
+            except OSError:
+                pass
+
+
+def load_arrays(path: str, version: int, mmap: bool = True):
+    """
+    Returns (meta, {name: array}) for a directory written by save_arrays,
+    memory-mapping the arrays unless `mmap` is False.
+    Raises ValueError when the format version does not match.
+    """
+    for attempt in range(2):
+        with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != version:
+            raise ValueError(f"Unsupported format version in {path}.")
+        if "generation" in meta:
+            suffix, names = f".{meta['generation']}.npy", meta["arrays"]
+        else:
+            # Saved before generations were introduced: plain <name>.npy files
+            suffix = ".npy"
+            names = [f[:-4] for f in os.listdir(path) if f.endswith(".npy") and "." not in f[:-4]]
+        try:
+            return meta, {name: _load(os.path.join(path, name + suffix), mmap) for name in names}
+        except FileNotFoundError:
+            # A concurrent save removed the generation named by the meta.json just read
+            if attempt:
+                raise
+
+
+def _load(file_path: str, mmap: bool):
+    array = np.load(file_path, mmap_mode="r" if mmap else None)
+    # Empty arrays cannot be memory-mapped on every platform
+    return array if array.size or not mmap else np.load(file_path)
@@ -0,0 +1,318 @@
+import os
+import re
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+
+from llama_index.core.base.response.schema import Response, StreamingResponse
+from llama_index.core.schema import MetadataMode, QueryBundle
+
+from src.metrics import METRICS
+from src.tokens import estimate_tokens
+
+FINGERPRINT_CHECK_INTERVAL = 1.0  # Seconds between two checks of the persisted index
+
+
+class DiskCacheBackend:
+    """SQLite table of pickled values with an expiry time and an LRU size cap."""
+
+    def __init__(self, path: str, table: str, max_size: int):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._table = table
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} "
+            "(key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str):
+        """Returns (value, expires), or None when the key is missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT value, expires FROM {self._table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] is not None and row[1] < now:
+                self._conn.execute(f"DELETE FROM {self._table} WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(f"UPDATE {self._table} SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        return pickle.loads(row[0]), row[1]
+
+    def set(self, key: str, value, expires):
+        with self._lock:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self._table} VALUES (?, ?, ?, ?)",
+                (key, pickle.dumps(value), expires, time.time()),
+            )
+            # Evict the least recently used rows beyond the cap
+            self._conn.execute(
+                f"DELETE FROM {self._table} WHERE key IN (SELECT key FROM {self._table} "
+                "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self._max_size,)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute(f"DELETE FROM {self._table}")
+            self._conn.commit()
+
+    def swap_meta(self, name: str, value: str):
+        """Stores `value` under `name` in the shared meta table, returns the previous value."""
+        with self._lock:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            row = self._conn.execute("SELECT value FROM meta WHERE name = ?", (name,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (name, value))
+            self._conn.commit()
+        return row[0] if row else None
+
+
+class LRUCache:
+    """
+    Thread-safe, size-bounded LRU cache with a time-to-live, optionally
+    backed by a DiskCacheBackend so entries survive restarts.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 3600, disk: DiskCacheBackend = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._disk = disk
+        self._data = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and (entry[0] is None or entry[0] >= time.time()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self._data.pop(key, None)
+
+        row = self._disk.get(key) if self._disk else None
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        # Promoted entries keep the expiry time they were stored with
+        value, expires = row
+        self._remember(key, value, expires)
+        return value
+
+    def set(self, key: str, value):
+        expires = time.time() + self.ttl if self.ttl else None
+        self._remember(key, value, expires)
+        if self._disk:
+            self._disk.set(key, value, expires)
+
+    def _remember(self, key: str, value, expires=None):
+        if expires is None and self.ttl:
+            expires = time.time() + self.ttl
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+        if self._disk:
+            self._disk.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+def normalize_query(query: str) -> str:
+    """Folds width/case, collapses whitespace and drops trailing punctuation."""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!.。？！ ")
+
+
+def index_fingerprint(persist_dir: str) -> str:
+    """Changes whenever a file of the persisted index is rewritten."""
+    entries = []
+    for root, _, files in os.walk(persist_dir):
+        for name in files:
+            stat = os.stat(os.path.join(root, name))
+            entries.append(f"{os.path.relpath(os.path.join(root, name), persist_dir)}:"
+                           f"{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("\n".join(sorted(entries)).encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    """
+    Two-level cache for the query engine:
+      1. normalized query            -> retrieved nodes
+      2. context hash + prompt + query -> final response text
+    Both levels are cleared automatically when the persisted index changes:
+    at startup, against the fingerprint stored with the disk cache, and
+    while running, after which the cache is marked `stale` and stops
+    serving and storing answers (the loaded index no longer matches the
+    disk, the query engine has to be reloaded).
+    """
+
+    def __init__(self, persist_dir: str, max_size: int = 1024, ttl: float = 3600,
+                 disk_path: str = None):
+        def disk(table):
+            return DiskCacheBackend(disk_path, table, max_size * 10) if disk_path else None
+
+        self.persist_dir = persist_dir
+        responses_disk = disk("responses")
+        self.retrieval = LRUCache(max_size, ttl, disk("retrieval"))
+        self.responses = LRUCache(max_size, ttl, responses_disk)
+        self.stale = False
+        self._fingerprint = index_fingerprint(persist_dir)
+        self._checked = time.monotonic()
+        self._lock = threading.Lock()
+
+        # The disk cache may have been filled from an index rebuilt since
+        if responses_disk:
+            previous = responses_disk.swap_meta("index_fingerprint", self._fingerprint)
+            if previous is not None and previous != self._fingerprint:
+                print(">> [CACHE] Index changed since the cache was written, clearing query caches.")
+                self.retrieval.clear()
+                self.responses.clear()
+
+    def check_index(self) -> bool:
+        """
+        Returns False once the index on disk was rebuilt (checked at most
+        once a second); both levels are then cleared and the cache is stale.
+        """
+        with self._lock:
+            if self.stale:
+                return False
+            if time.monotonic() - self._checked < FINGERPRINT_CHECK_INTERVAL:
+                return True
+            self._checked = time.monotonic()
+            if index_fingerprint(self.persist_dir) == self._fingerprint:
+                return True
+            self.stale = True
+        print(">> [CACHE] Index changed on disk, clearing query caches. Caching is "
+              "disabled until the query engine is reloaded (restart query.py / server.py).")
+        self.retrieval.clear()
+        self.responses.clear()
+        return False
+
+    @staticmethod
+    def response_key(nodes, template, query_key: str) -> str:
+        # The normalized query is part of the key: two phrasings can retrieve
+        # the same context and still need different answers.
+        digest = hashlib.sha256()
+        for node in nodes:
+            digest.update(node.node.get_content(metadata_mode=MetadataMode.LLM).encode("utf-8"))
+            digest.update(b"\x00")
+        digest.update(template.get_template().encode("utf-8"))
+        digest.update(b"\x00" + query_key.encode("utf-8"))
+        return digest.hexdigest()
+
+    def stats(self) -> dict:
+        return {"retrieval": self.retrieval.stats(), "responses": self.responses.stats(),
+                "stale": self.stale}
+
+
+class CachedQueryEngine:
+    """
+    Same query() interface as RetrieverQueryEngine, with both retrieval and
+    synthesis going through a QueryCache. A repeated query costs no tokens.
+    Without a cache every query goes through retrieval and synthesis.
+    `node_postprocessors` run between the two (the cache keeps the raw
+    retrieved nodes, answers are keyed on the postprocessed context).
+    """
+
+    def __init__(self, retriever, response_synthesizer, template, cache: QueryCache = None,
+                 node_postprocessors=None):
+        self.retriever = retriever
+        self.response_synthesizer = response_synthesizer
+        self.template = template
+        self.cache = cache
+        self.node_postprocessors = node_postprocessors or []
+
+    def query(self, query):
+        bundle = query if isinstance(query, QueryBundle) else QueryBundle(query_str=query)
+        if self.cache is None or not self.cache.check_index():
+            return self._synthesize(bundle, self._postprocess(self._retrieve(bundle), bundle), None)
+
+        query_key = normalize_query(bundle.query_str)
+
+        # Level 1: retrieved nodes
+        nodes = self.cache.retrieval.get(query_key)
+        if nodes is None:
+            nodes = self._retrieve(bundle)
+            self.cache.retrieval.set(query_key, nodes)
+        nodes = self._postprocess(nodes, bundle)
+
+        # Level 2: final response for this context + prompt
+        response_key = QueryCache.response_key(nodes, self.template, query_key)
+        cached = self.cache.responses.get(response_key)
+        if cached is not None:
+            METRICS.count("query.cache_hits")
+            return Response(response=cached, source_nodes=nodes, metadata={"cache_hit": True})
+        return self._synthesize(bundle, nodes, response_key)
+
+    def _retrieve(self, bundle):
+        with METRICS.timer("query.retrieve"):
+            return self.retriever.retrieve(bundle)
+
+    def _postprocess(self, nodes, bundle):
+        with METRICS.timer("query.postprocess"):
+            for postprocessor in self.node_postprocessors:
+                nodes = postprocessor.postprocess_nodes(nodes, query_bundle=bundle)
+        return nodes
+
+    def _synthesize(self, bundle, nodes, response_key):
+        # Estimated from the prompt the 'compact' synthesizer sends for these nodes
+        context = "\n\n".join(n.node.get_content(metadata_mode=MetadataMode.LLM) for n in nodes)
+        METRICS.count("llm.tokens_in", estimate_tokens(
+            self.template.format(context_str=context, query_str=bundle.query_str)
+        ))
+        with METRICS.timer("query.synthesize"):
+            response = self.response_synthesizer.synthesize(query=bundle, nodes=nodes)
+
+        if isinstance(response, StreamingResponse) and response.response_gen is not None:
+            response.response_gen = self._finish_stream(response.response_gen, response_key)
+        elif response.response is not None:
+            METRICS.count("llm.tokens_out", estimate_tokens(response.response))
+            self._store(response_key, response.response)
+        return response
+
+    def _finish_stream(self, response_gen, response_key):
+        """Passes tokens through; counts and caches the full answer once the stream completes."""
+        start = time.perf_counter()
+        tokens = []
+        for token in response_gen:
+            tokens.append(token)
+            yield token
+        answer = "".join(tokens)
+        METRICS.record_time("query.stream", time.perf_counter() - start)
+        METRICS.count("llm.tokens_out", estimate_tokens(answer))
+        self._store(response_key, answer)
+
+    def _store(self, response_key, answer):
+        # An index change detected meanwhile means the answer came from the old index
+        if response_key is not None and not self.cache.stale:
+            self.cache.responses.set(response_key, answer)
@@ -9,9 +9,15 @@ from llama_index.core import Settings
 from llama_index.llms.openai_like import OpenAILike 
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 
-def init_settings(deepseek_api_key: str):
+from src.embeddings import CachedEmbedding, EmbeddingCache
+
+# Embeddings survive rebuilds here, keyed by model name + text hash
+EMBEDDING_CACHE_PATH = "./cache/embeddings.sqlite"
+
+def init_settings(deepseek_api_key: str, embedding_cache_path: str = EMBEDDING_CACHE_PATH):
     """
     Initializes global settings with DeepSeek (LLM) and BGE-M3 (Embedding).
+    BGE-M3 is wrapped in an on-disk cache so already-seen texts are never re-encoded.
     """
     if not deepseek_api_key:
         raise ValueError("DeepSeek API Key is missing. Please check your .env file.")
@@ -48,6 +54,7 @@ def init_settings(deepseek_api_key: str):
         model_name="BAAI/bge-m3",
         device=device_type
     )
+    embed_model = CachedEmbedding(embed_model, EmbeddingCache(embedding_cache_path))
 
     # 5. Apply Global Settings
     Settings.llm = llm
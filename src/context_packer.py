@@ -0,0 +1,183 @@
+import re
+import ast
+from typing import List, Optional
+
+from pydantic import PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle, TextNode
+
+from src.metrics import METRICS
+from src.tokens import estimate_tokens
+
+MAX_CONTEXT_TOKENS = 2000     # Whole packed context
+MAX_SUMMARY_TOKENS = 250      # Summary text kept per book
+MAX_TRIPLETS_PER_BOOK = 5
+ELLIPSIS = "……"
+
+# Header lines written by src/loader.py, rebuilt from metadata for every book
+HEADER_PATTERN = re.compile(r"^(BOOK TITLE:.*|SOURCE ID:.*|SUMMARY:)\s*$", re.MULTILINE)
+SENTENCE_END = re.compile(r"(?<=[。！？；.!?;])")
+
+
+def _parse_triplet(text: str):
+    """"('a', 'rel', 'b')" or "['a', 'rel', 'b']" -> ('a', 'rel', 'b'), None if not a triplet."""
+    try:
+        value = ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        return None
+    if isinstance(value, (list, tuple)) and len(value) == 3:
+        return tuple(str(part) for part in value)
+    return None
+
+
+def _format_triplet(triplet) -> str:
+    subj, rel, obj = triplet
+    return f"{subj} -[{rel}]-> {obj}"
+
+
+def trim_to_tokens(text: str, max_tokens: int) -> str:
+    """Keeps whole sentences while they fit in `max_tokens`, cutting the first one if none does."""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens - estimate_tokens(ELLIPSIS)
+    kept = ""
+    for sentence in SENTENCE_END.split(text):
+        if estimate_tokens(kept + sentence) > budget:
+            break
+        kept += sentence
+    if not kept:
+        # Binary search on the character count (estimate_tokens is monotonic)
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if estimate_tokens(text[:mid]) <= budget:
+                lo = mid
+            else:
+                hi = mid - 1
+        kept = text[:lo]
+    return kept.rstrip() + ELLIPSIS if kept.strip() else ""
+
+
+class ContextPacker(BaseNodePostprocessor):
+    """
+    Packs retrieved nodes into a smaller context for 'compact' synthesis.
+
+    Text chunks and KG triplets are grouped by book_id into one block per
+    book (BOOK TITLE / SOURCE ID / RELATIONS / SUMMARY), duplicates are
+    removed, books are ranked by how many retrieved triplets mention them,
+    and summaries are trimmed so the whole context fits `max_context_tokens`.
+    Triplets that mention no retrieved book are kept at the end if room is left.
+    """
+
+    max_context_tokens: int = MAX_CONTEXT_TOKENS
+    max_summary_tokens: int = MAX_SUMMARY_TOKENS
+    max_triplets_per_book: int = MAX_TRIPLETS_PER_BOOK
+    verbose: bool = False
+
+    _last_stats: dict = PrivateAttr(default_factory=dict)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ContextPacker"
+
+    @property
+    def last_stats(self) -> dict:
+        """Tokens before/after packing for the last call."""
+        return self._last_stats
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        tokens_before = sum(
+            estimate_tokens(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in nodes
+        )
+
+        # 1. Group chunks by book, keep triplets and any other node aside
+        books = {}          # book_id -> {"name", "chunks", "triplets", "rank"}
+        triplets = []
+        passthrough = []
+        for rank, n in enumerate(nodes):
+            metadata = n.node.metadata
+            if "kg_rel_texts" in metadata:
+                for text in metadata["kg_rel_texts"]:
+                    triplet = _parse_triplet(text)
+                    if triplet is not None and triplet not in triplets:
+                        triplets.append(triplet)
+            elif "book_id" in metadata:
+                book = books.setdefault(metadata["book_id"], {
+                    "name": metadata.get("book_name", ""), "chunks": [], "triplets": [], "rank": rank,
+                })
+                summary = HEADER_PATTERN.sub("", n.node.get_content()).strip()
+                if summary and summary not in book["chunks"]:
+                    book["chunks"].append(summary)
+            else:
+                passthrough.append(n)
+
+        # 2. Attach each triplet to the book it names, or whose summary contains
+        #    its object (subjects are often generic: "作者", "本书", ...)
+        loose = []
+        for triplet in triplets:
+            subj, _, obj = triplet
+            owner = next((b for b in books.values() if b["name"] in (subj, obj)), None)
+            if owner is None:
+                owner = next((b for b in books.values()
+                              if any(obj in c for c in b["chunks"])), None)
+            (owner["triplets"] if owner else loose).append(triplet)
+
+        # 3. Rank: books backed by more triplets first, then retrieval order
+        ranked = sorted(books.items(), key=lambda item: (-len(item[1]["triplets"]), item[1]["rank"]))
+
+        # 4. Fill the budget book by book
+        remaining = self.max_context_tokens
+        packed = []
+        for book_id, book in ranked:
+            header = f"BOOK TITLE: {book['name']}\nSOURCE ID: {book_id}"
+            relations = [_format_triplet(t) for t in book["triplets"][:self.max_triplets_per_book]]
+            if relations:
+                header += "\nRELATIONS: " + "; ".join(relations)
+            header_tokens = estimate_tokens(header)
+            if packed and header_tokens > remaining:
+                break
+            summary_budget = min(self.max_summary_tokens, remaining - header_tokens)
+            summary = trim_to_tokens(" ".join(book["chunks"]), summary_budget)
+            text = f"{header}\nSUMMARY:\n{summary}" if summary else header
+            remaining -= estimate_tokens(text)
+            packed.append(NodeWithScore(
+                node=TextNode(
+                    text=text,
+                    metadata={"book_id": book_id, "book_name": book["name"]},
+                    # Title and ID are already in the text
+                    excluded_llm_metadata_keys=["book_id", "book_name"],
+                    excluded_embed_metadata_keys=["book_id", "book_name"],
+                ),
+                score=nodes[book["rank"]].score,
+            ))
+
+        facts = []
+        for triplet in loose:
+            line = _format_triplet(triplet)
+            if estimate_tokens(line) > remaining:
+                break
+            remaining -= estimate_tokens(line)
+            facts.append(line)
+        if facts:
+            packed.append(NodeWithScore(node=TextNode(text="RELATED FACTS:\n" + "\n".join(facts)), score=1.0))
+        packed.extend(passthrough)
+
+        # 5. Report
+        tokens_after = sum(
+            estimate_tokens(n.node.get_content(metadata_mode=MetadataMode.LLM)) for n in packed
+        )
+        self._last_stats = {"books": len(books), "triplets": len(triplets),
+                            "tokens_before": tokens_before, "tokens_after": tokens_after,
+                            "tokens_saved": tokens_before - tokens_after}
+        METRICS.observe("pack.tokens_before", tokens_before)
+        METRICS.observe("pack.tokens_after", tokens_after)
+        METRICS.count("pack.tokens_saved", tokens_before - tokens_after)
+        if self.verbose:
+            saved = 100 * (tokens_before - tokens_after) / tokens_before if tokens_before else 0.0
+            print(f">> [PACK] {len(books)} books, {len(triplets)} triplets: "
+                  f"{tokens_before} -> {tokens_after} context tokens (-{saved:.0f}%)")
+        return packed
@@ -0,0 +1,135 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from typing import Any, List
+
+import numpy as np
+from pydantic import PrivateAttr
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+from src.metrics import METRICS
+
+CACHE_BATCH_SIZE = 256  # Texts looked up (and encoded on miss) per call
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache (SQLite) keyed by sha256(model name + text).
+    Vectors are stored as raw float32 bytes.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name: str, kind: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\x00{kind}\x00{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> dict:
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's limit on bound parameters
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                )
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items: dict):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    Wraps an embedding model with an EmbeddingCache.
+    Cached texts are never re-encoded; the misses of a batch are encoded
+    together in a single call to the wrapped model.
+    Queries bypass the cache: they are not worth keeping on disk, and
+    repeated queries are answered by the query cache (src/cache.py).
+    """
+
+    _model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, model: BaseEmbedding, cache: EmbeddingCache, **kwargs: Any):
+        super().__init__(
+            model_name=model.model_name,
+            embed_batch_size=CACHE_BATCH_SIZE,
+            **kwargs
+        )
+        self._model = model
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    @property
+    def model(self) -> BaseEmbedding:
+        """The wrapped embedding model."""
+        return self._model
+
+    def _embed(self, texts: List[str], kind: str) -> List[List[float]]:
+        METRICS.observe(f"embed.{kind}_batch_size", len(texts))
+        keys = [EmbeddingCache.make_key(self.model_name, kind, text) for text in texts]
+        found = self._cache.get_many(list(set(keys)))
+
+        # Encode each missing text once, even if it appears several times
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing.setdefault(key, text)
+        METRICS.count("embed.cache_hits", len(texts) - len(missing))
+        METRICS.count("embed.encoded", len(missing))
+        if missing:
+            with METRICS.timer("embed.encode"):
+                vectors = self._model.get_text_embedding_batch(list(missing.values()))
+            new_items = dict(zip(missing.keys(), vectors))
+            self._cache.put_many(new_items)
+            found.update(new_items)
+        return [found[key] for key in keys]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        METRICS.observe("embed.query_batch_size", 1)
+        with METRICS.timer("embed.encode"):
+            return self._model.get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._embed([text], "text")[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "text")
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._model.aget_query_embedding(query)
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return self._get_text_embeddings(texts)
@@ -0,0 +1,252 @@
+import os
+from collections import deque, defaultdict
+from typing import List
+
+import numpy as np
+
+from src.array_store import load_arrays, save_arrays
+
+ENTITY_INDEX_DIR = "entity_index"
+LEGACY_INDEX_FILE = "entity_index.json"   # JSON format of earlier builds, replaced on save
+FORMAT_VERSION = 2
+MIN_ENTITY_CHARS = 2        # Single characters ("书", "A") match almost any query
+NGRAM_MIN_SCORE = 0.5       # Share of an entity's bigrams that must appear in the query
+
+
+def _normalize(text: str) -> str:
+    # The triplet parser capitalizes entities; queries are matched case-insensitively
+    return text.strip().lower()
+
+
+def _bigrams(text: str):
+    return {text[i:i + 2] for i in range(len(text) - 1) if not text[i:i + 2].isspace()}
+
+
+def _bigram_key(bigram: str) -> int:
+    # Code points fit in 21 bits, so a bigram packs into one int64
+    return (ord(bigram[0]) << 21) | ord(bigram[1])
+
+
+def _csr(rows):
+    """List of int lists -> (indptr int64[n + 1], values int32[...])."""
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(row) for row in rows], out=indptr[1:])
+    values = np.fromiter((v for row in rows for v in row), dtype=np.int32, count=int(indptr[-1]))
+    return indptr, values
+
+
+class EntityMatcher:
+    """
+    Finds graph entities mentioned in a query without calling the LLM.
+
+    An Aho-Corasick automaton over all entity names finds exact mentions
+    in one pass over the query. When nothing matches (e.g. the user wrote
+    "人工智能的书" but the entity is "人工智能技术"), entities are ranked by
+    how many of their character bigrams appear in the query.
+
+    Everything is stored as flat arrays, memory-mapped at load time like
+    CompactGraphStore: transitions in CSR form (per state, sorted code
+    points and next states), the failure and dictionary-suffix links, and
+    the bigram inverted index keyed by packed code point pairs.
+    """
+
+    def __init__(self, arrays):
+        self._goto_ptr = arrays["goto_ptr"]          # int64[S + 1], transitions of state s
+        self._goto_char = arrays["goto_char"]        # int32[T], sorted code points per state
+        self._goto_next = arrays["goto_next"]        # int32[T], target state of each transition
+        self._fail = arrays["fail"]                  # int32[S], failure link
+        self._state_entity = arrays["state_entity"]  # int32[S], entity ending at s, or -1
+        self._dict_link = arrays["dict_link"]        # int32[S], next state on the failure chain with an entity, or -1
+        self._norm_len = arrays["norm_len"]          # int32[n], characters of each normalized name
+        self._bigram_count = arrays["bigram_count"]  # int32[n], distinct bigrams of each normalized name
+        self._bigram_keys = arrays["bigram_keys"]    # int64[B], sorted packed bigrams
+        self._bigram_ptr = arrays["bigram_ptr"]      # int64[B + 1]
+        self._bigram_ids = arrays["bigram_ids"]      # int32[...], entity IDs per bigram
+        self._name_ptr = arrays["name_ptr"]          # int64[n + 1], original names of entity i
+        self._name_offsets = arrays["name_offsets"]  # int64[N + 1], byte offsets into name_blob
+        self._name_blob = arrays["name_blob"]        # uint8[...], UTF-8 original names
+
+    @classmethod
+    def from_entities(cls, names) -> "EntityMatcher":
+        grouped = defaultdict(list)
+        for name in names:
+            norm = _normalize(name)
+            if len(norm) >= MIN_ENTITY_CHARS and name not in grouped[norm]:
+                grouped[norm].append(name)
+        norms = sorted(grouped)
+
+        # 1. Trie of all normalized names
+        goto, state_entity = [{}], [-1]
+        for eid, norm in enumerate(norms):
+            state = 0
+            for ch in norm:
+                if ch not in goto[state]:
+                    goto.append({})
+                    state_entity.append(-1)
+                    goto[state][ch] = len(goto) - 1
+                state = goto[state][ch]
+            state_entity[state] = eid
+
+        # 2. Failure and dictionary-suffix links, breadth first
+        fail = [0] * len(goto)
+        dict_link = [-1] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                dict_link[nxt] = fail[nxt] if state_entity[fail[nxt]] >= 0 else dict_link[fail[nxt]]
+
+        # 3. Bigram inverted index for the fuzzy fallback
+        bigram_index = defaultdict(list)
+        bigram_count = []
+        for eid, norm in enumerate(norms):
+            bigrams = _bigrams(norm)
+            bigram_count.append(len(bigrams))
+            for bigram in bigrams:
+                bigram_index[_bigram_key(bigram)].append(eid)
+        bigram_keys = sorted(bigram_index)
+
+        transitions = [sorted((ord(ch), nxt) for ch, nxt in edges.items()) for edges in goto]
+        goto_ptr, goto_char = _csr([[c for c, _ in row] for row in transitions])
+        _, goto_next = _csr([[n for _, n in row] for row in transitions])
+        bigram_ptr, bigram_ids = _csr([bigram_index[key] for key in bigram_keys])
+        name_ptr = np.zeros(len(norms) + 1, dtype=np.int64)
+        np.cumsum([len(grouped[norm]) for norm in norms], out=name_ptr[1:])
+        encoded = [name.encode("utf-8") for norm in norms for name in grouped[norm]]
+        name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+
+        return cls({
+            "goto_ptr": goto_ptr,
+            "goto_char": goto_char,
+            "goto_next": goto_next,
+            "fail": np.asarray(fail, dtype=np.int32),
+            "state_entity": np.asarray(state_entity, dtype=np.int32),
+            "dict_link": np.asarray(dict_link, dtype=np.int32),
+            "norm_len": np.asarray([len(norm) for norm in norms], dtype=np.int32),
+            "bigram_count": np.asarray(bigram_count, dtype=np.int32),
+            "bigram_keys": np.asarray(bigram_keys, dtype=np.int64),
+            "bigram_ptr": bigram_ptr,
+            "bigram_ids": bigram_ids,
+            "name_ptr": name_ptr,
+            "name_offsets": name_offsets,
+            "name_blob": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        })
+
+    @classmethod
+    def from_graph_dict(cls, graph_dict) -> "EntityMatcher":
+        names = set(graph_dict)
+        for edges in graph_dict.values():
+            names.update(obj for _, obj in edges)
+        return cls.from_entities(names)
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "EntityMatcher":
+        """Memory-maps an index saved with `save()`."""
+        _, arrays = load_arrays(os.path.join(persist_dir, ENTITY_INDEX_DIR), FORMAT_VERSION)
+        return cls(arrays)
+
+    def save(self, persist_dir: str):
+        """Safe while other processes have the previous index mapped (see src/array_store.py)."""
+        save_arrays(os.path.join(persist_dir, ENTITY_INDEX_DIR), {
+            "goto_ptr": self._goto_ptr,
+            "goto_char": self._goto_char,
+            "goto_next": self._goto_next,
+            "fail": self._fail,
+            "state_entity": self._state_entity,
+            "dict_link": self._dict_link,
+            "norm_len": self._norm_len,
+            "bigram_count": self._bigram_count,
+            "bigram_keys": self._bigram_keys,
+            "bigram_ptr": self._bigram_ptr,
+            "bigram_ids": self._bigram_ids,
+            "name_ptr": self._name_ptr,
+            "name_offsets": self._name_offsets,
+            "name_blob": self._name_blob,
+        }, {"version": FORMAT_VERSION, "count": len(self)})
+        legacy_path = os.path.join(persist_dir, LEGACY_INDEX_FILE)
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    def __len__(self):
+        return len(self._norm_len)
+
+    def _names(self, eid: int) -> List[str]:
+        return [
+            self._name_blob[self._name_offsets[i]:self._name_offsets[i + 1]].tobytes().decode("utf-8")
+            for i in range(int(self._name_ptr[eid]), int(self._name_ptr[eid + 1]))
+        ]
+
+    def _next_state(self, state: int, ch: str) -> int:
+        """Transition of `state` on `ch`, -1 when there is none."""
+        start, end = int(self._goto_ptr[state]), int(self._goto_ptr[state + 1])
+        code = ord(ch)
+        pos = start + int(np.searchsorted(self._goto_char[start:end], code))
+        return int(self._goto_next[pos]) if pos < end and self._goto_char[pos] == code else -1
+
+    def _exact_matches(self, text: str):
+        """(start, end, id) of every entity occurrence in `text`."""
+        hits = []
+        state = 0
+        for i, ch in enumerate(text):
+            nxt = self._next_state(state, ch)
+            while state and nxt < 0:
+                state = int(self._fail[state])
+                nxt = self._next_state(state, ch)
+            state = max(nxt, 0)
+            match = state if self._state_entity[state] >= 0 else int(self._dict_link[state])
+            while match >= 0:
+                eid = int(self._state_entity[match])
+                hits.append((i + 1 - int(self._norm_len[eid]), i + 1, eid))
+                match = int(self._dict_link[match])
+        return hits
+
+    def _fuzzy_matches(self, text: str, max_entities: int):
+        shared = defaultdict(int)
+        keys = np.asarray(sorted(_bigram_key(bigram) for bigram in _bigrams(text)), dtype=np.int64)
+        positions = np.searchsorted(self._bigram_keys, keys)
+        for key, pos in zip(keys.tolist(), positions.tolist()):
+            if pos < len(self._bigram_keys) and self._bigram_keys[pos] == key:
+                for eid in self._bigram_ids[self._bigram_ptr[pos]:self._bigram_ptr[pos + 1]].tolist():
+                    shared[eid] += 1
+
+        scored = []
+        for eid, count in shared.items():
+            score = count / int(self._bigram_count[eid])
+            if score >= NGRAM_MIN_SCORE:
+                scored.append((score, count, eid))
+        scored.sort(key=lambda item: (-item[0], -item[1], item[2]))
+        return [eid for _, _, eid in scored[:max_entities]]
+
+    def match(self, query: str, max_entities: int = 10) -> List[str]:
+        """
+        Entity names mentioned in the query, in order of appearance.
+        Overlapping mentions keep the longest one ("人工智能" over "智能").
+        """
+        text = _normalize(query)
+        hits = self._exact_matches(text)
+
+        chosen = []
+        taken = set()
+        for start, end, eid in sorted(hits, key=lambda h: (-(h[1] - h[0]), h[0])):
+            if any(pos in taken for pos in range(start, end)):
+                continue
+            taken.update(range(start, end))
+            chosen.append((start, eid))
+        eids = [eid for _, eid in sorted(chosen)] or self._fuzzy_matches(text, max_entities)
+
+        names = []
+        for eid in eids:
+            for name in self._names(eid):
+                if name not in names:
+                    names.append(name)
+        return names[:max_entities]
+
+
+def has_entity_index(persist_dir: str) -> bool:
+    return os.path.exists(os.path.join(persist_dir, ENTITY_INDEX_DIR, "meta.json"))
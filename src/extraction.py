@@ -0,0 +1,121 @@
+import time
+import random
+import asyncio
+from llama_index.core import KnowledgeGraphIndex, Settings
+from llama_index.core.schema import MetadataMode
+
+from src.metrics import METRICS
+from src.rate_limit import TokenBucket
+from src.tokens import estimate_tokens
+
+# Same limit KnowledgeGraphIndex applies to each part of a triplet (in bytes)
+MAX_OBJECT_LENGTH = 128
+RETRY_BASE_DELAY = 1.0   # Seconds, doubled after each failed attempt
+RETRY_MAX_DELAY = 30.0
+
+
+async def aextract_triplets(node, template, llm=None):
+    """
+    Asks the LLM for the (subject, relation, object) triplets of one chunk.
+    Mirrors what KnowledgeGraphIndex does internally so incremental builds
+    produce exactly the same graph as KnowledgeGraphIndex.from_documents.
+    Returns the parsed triplets and the raw LLM response.
+    """
+    llm = llm or Settings.llm
+    response = await llm.apredict(
+        template,
+        text=node.get_content(metadata_mode=MetadataMode.LLM),
+    )
+    return KnowledgeGraphIndex._parse_triplet_response(
+        response, max_length=MAX_OBJECT_LENGTH
+    ), response
+
+
+async def _aextract_all(nodes, template, llm, max_concurrency, request_bucket,
+                        token_bucket, max_retries, stats):
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def extract_one(node):
+        prompt_tokens = estimate_tokens(
+            template.format(text=node.get_content(metadata_mode=MetadataMode.LLM))
+        )
+        for attempt in range(max_retries + 1):
+            async with semaphore:
+                if request_bucket:
+                    await request_bucket.acquire(1)
+                if token_bucket:
+                    await token_bucket.acquire(prompt_tokens)
+                start = time.perf_counter()
+                try:
+                    triplets, response = await aextract_triplets(node, template, llm)
+                except Exception as e:
+                    error = e
+                else:
+                    response_tokens = estimate_tokens(response)
+                    METRICS.record_time("llm.extract_request", time.perf_counter() - start)
+                    METRICS.count("llm.tokens_in", prompt_tokens)
+                    METRICS.count("llm.tokens_out", response_tokens)
+                    if token_bucket:
+                        token_bucket.charge(response_tokens)
+                    return triplets
+
+            # Back off outside the semaphore so other chunks keep flowing
+            if attempt < max_retries:
+                stats["retries"] += 1
+                delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+        stats["failed"] += 1
+        print(f">> [EXTRACT] Giving up on chunk {node.node_id}: {error}")
+        return None
+
+    # gather() keeps the input order, whatever order the responses arrive in
+    return await asyncio.gather(*(extract_one(node) for node in nodes))
+
+
+def extract_triplets_concurrently(
+    nodes,
+    template,
+    llm=None,
+    max_concurrency: int = 8,
+    requests_per_minute: float = None,
+    tokens_per_minute: float = None,
+    max_retries: int = 4,
+    request_bucket: TokenBucket = None,
+    token_bucket: TokenBucket = None,
+    loop: asyncio.AbstractEventLoop = None
+):
+    """
+    Extracts the triplets of many chunks with up to `max_concurrency`
+    requests in flight, optionally rate limited per minute.
+    Pass the same `request_bucket` / `token_bucket` to successive calls to
+    enforce the limits across them; otherwise each call starts full buckets.
+    Successive calls should also share one event `loop`: the LLM's async HTTP
+    client keeps pooled connections bound to the event loop that opened
+    them, and they break once that loop is closed.
+    Returns (results, stats): results[i] holds the triplets of nodes[i],
+    or None when that chunk still failed after `max_retries` retries.
+    """
+    llm = llm or Settings.llm
+    stats = {"chunks": len(nodes), "failed": 0, "retries": 0}
+    if request_bucket is None and requests_per_minute:
+        request_bucket = TokenBucket(requests_per_minute)
+    if token_bucket is None and tokens_per_minute:
+        token_bucket = TokenBucket(tokens_per_minute)
+
+    start = time.perf_counter()
+    coroutine = _aextract_all(
+        nodes, template, llm, max_concurrency, request_bucket,
+        token_bucket, max_retries, stats
+    )
+    results = loop.run_until_complete(coroutine) if loop else asyncio.run(coroutine)
+    stats["seconds"] = time.perf_counter() - start
+    stats["chunks_per_second"] = len(nodes) / stats["seconds"] if stats["seconds"] else 0.0
+    METRICS.count("build.chunks", len(nodes))
+    METRICS.count("build.failed_chunks", stats["failed"])
+    METRICS.count("build.retries", stats["retries"])
+
+    print(f">> [EXTRACT] {len(nodes)} chunks in {stats['seconds']:.1f}s "
+          f"({stats['chunks_per_second']:.1f} chunks/s, {stats['failed']} failed, "
+          f"{stats['retries']} retries)")
+    return results, stats
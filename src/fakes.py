@@ -0,0 +1,118 @@
+"""
+Local stand-ins for DeepSeek, used to test and benchmark the pipelines
+offline. They add a fixed delay per call to mimic network round-trips.
+"""
+import re
+import time
+import asyncio
+import hashlib
+from typing import Any, List
+
+import numpy as np
+
+from pydantic import PrivateAttr
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.llms import (
+    CustomLLM,
+    CompletionResponse,
+    CompletionResponseGen,
+    LLMMetadata
+)
+
+TITLE_PATTERN = re.compile(r"^BOOK TITLE:\s*(.+)", re.MULTILINE)
+
+
+class FakeLLM(CustomLLM):
+    """
+    Answers triplet-extraction prompts with triplets built from the book
+    titles in the prompt, and any other prompt with a short recommendation.
+    """
+
+    delay: float = 0.2          # Seconds per request
+    token_delay: float = 0.0    # Extra seconds per streamed token
+    fail_every: int = 0         # Raise on every N-th request (0 = never)
+
+    _calls: int = PrivateAttr(default=0)
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(context_window=64000, num_output=3000, model_name="fake-llm")
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def _respond(self, prompt: str) -> str:
+        self._calls += 1
+        if self.fail_every and self._calls % self.fail_every == 0:
+            raise ConnectionError(f"FakeLLM: simulated failure on call {self._calls}")
+
+        titles = [t.strip() for t in TITLE_PATTERN.findall(prompt)]
+        if "triplet" in prompt.lower():
+            return "\n".join(
+                f"({title}, 属于, 图书)\n(本书, 介绍, {title}的内容)" for title in titles[-1:]
+            )
+        return "\n".join(f" 书名： 《{title}》\n 推荐理由： 相关主题。" for title in titles[:5])
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        time.sleep(self.delay)
+        return CompletionResponse(text=self._respond(prompt))
+
+    async def acomplete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        await asyncio.sleep(self.delay)
+        return CompletionResponse(text=self._respond(prompt))
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponseGen:
+        time.sleep(self.delay)
+        text = self._respond(prompt)
+
+        def gen() -> CompletionResponseGen:
+            so_far = ""
+            for token in re.findall(r"\S+\s*", text):
+                time.sleep(self.token_delay)
+                so_far += token
+                yield CompletionResponse(text=so_far, delta=token)
+
+        return gen()
+
+
+class FakeEmbedding(BaseEmbedding):
+    """
+    Deterministic pseudo-random unit vectors seeded by the text hash,
+    with a fixed delay per encoder call (one call per batch).
+    """
+
+    embed_dim: int = 64
+    delay: float = 0.01         # Seconds per encoder call
+
+    _batch_sizes: List[int] = PrivateAttr(default_factory=list)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "FakeEmbedding"
+
+    @property
+    def batch_sizes(self) -> List[int]:
+        return self._batch_sizes
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+        vector = np.random.default_rng(seed).standard_normal(self.embed_dim)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        time.sleep(self.delay)
+        self._batch_sizes.append(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embedding(text)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import argparse
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional
+
+GENERIC_ENTITIES = {"本书", "该书", "此书", "这本书", "全书", "本教材", "该教材", "本丛书"}
+MAX_NODE_DEGREE = 50          # Outgoing edges kept per entity in the query graph
+ALIASES_FILE = "entity_aliases.json"   # Optional {"alias": "canonical name"} map
+REFINE_INPUTS_FILE = "graph_refine.json"  # Settings the current query graph was refined with
+DEGREE_BUCKETS = [(1, 1), (2, 5), (6, 10), (11, 50), (51, 100), (101, None)]
+
+# Book-title marks, quotes and brackets that wrap an entity without changing it
+_WRAPPERS = "《》〈〉「」『』“”‘’\"'()（）[]【】 "
+
+
+def canonical_key(name: str) -> str:
+    """Entities with the same key are near-duplicates ("《铸工入门》" / "铸工入门")."""
+    text = unicodedata.normalize("NFKC", name).lower().strip(_WRAPPERS)
+    return re.sub(r"\s+", "", text)
+
+
+def _is_title(book_name) -> bool:
+    """False for missing titles: None, NaN (pandas) or blank strings."""
+    return isinstance(book_name, str) and bool(book_name.strip())
+
+
+def rewrite_generic(triplet, book_name: str):
+    """Replaces "本书"-style entities of a triplet by the title of the book it came from."""
+    if not _is_title(book_name):
+        return tuple(triplet)
+    subj, rel, obj = triplet
+    return (book_name if subj in GENERIC_ENTITIES else subj, rel,
+            book_name if obj in GENERIC_ENTITIES else obj)
+
+
+def load_aliases(persist_dir: str) -> Dict[str, str]:
+    path = os.path.join(persist_dir, ALIASES_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def refine_inputs(persist_dir: str, max_degree: int) -> dict:
+    """Everything besides graph_store.json that the refined query graph depends on."""
+    return {"max_degree": max_degree, "aliases": load_aliases(persist_dir)}
+
+
+def save_refine_inputs(persist_dir: str, max_degree: int):
+    with open(os.path.join(persist_dir, REFINE_INPUTS_FILE), "w", encoding="utf-8") as f:
+        json.dump(refine_inputs(persist_dir, max_degree), f, ensure_ascii=False)
+
+
+def refine_inputs_changed(persist_dir: str, max_degree: int) -> bool:
+    """True when --max-degree or entity_aliases.json changed since the query graph was refined."""
+    path = os.path.join(persist_dir, REFINE_INPUTS_FILE)
+    if not os.path.exists(path):
+        return True
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f) != refine_inputs(persist_dir, max_degree)
+
+
+class BookNameResolver:
+    """
+    Finds the book a triplet was extracted from, to resolve generic
+    entities in graphs built before they were rewritten at extraction.
+
+    The build manifest is exact; otherwise the chunks indexed under the
+    triplet's other entity (or, failing that, the chunks whose text
+    contains it) are used, when they all belong to one book.
+    """
+
+    def __init__(self, docstore, keyword_table: Dict[str, set] = None, manifest_documents: dict = None):
+        self._docstore = docstore
+        self._table = keyword_table or {}
+        self._node_books = {}
+        self._texts = None
+        self._triplet_docs = defaultdict(set)
+        for doc_id, entry in (manifest_documents or {}).items():
+            for triplet in entry["triplets"]:
+                self._triplet_docs[tuple(triplet)].add(doc_id)
+
+    def _doc_book(self, doc_id: str) -> Optional[str]:
+        info = self._docstore.get_ref_doc_info(doc_id)
+        return info.metadata.get("book_name") if info is not None else None
+
+    def _node_book(self, node_id: str) -> Optional[str]:
+        if node_id not in self._node_books:
+            node = self._docstore.get_node(node_id, raise_error=False)
+            self._node_books[node_id] = node.metadata.get("book_name") if node is not None else None
+        return self._node_books[node_id]
+
+    def resolve(self, triplet) -> Optional[str]:
+        subj, _, obj = triplet
+        books = {self._doc_book(doc_id) for doc_id in self._triplet_docs.get(tuple(triplet), ())}
+        anchor = obj if subj in GENERIC_ENTITIES else subj
+        if not books:
+            books = {self._node_book(node_id) for node_id in self._table.get(anchor, ())}
+        if not books:
+            if self._texts is None:
+                self._texts = [(node.metadata.get("book_name"), node.get_content())
+                               for node in self._docstore.docs.values()]
+            books = {book for book, text in self._texts if anchor in text}
+        books = {book for book in books if _is_title(book)}
+        return books.pop() if len(books) == 1 else None
+
+
+def refine_graph(
+    graph_dict: Dict[str, List[List[str]]],
+    resolver: BookNameResolver = None,
+    aliases: Dict[str, str] = None,
+    max_degree: int = MAX_NODE_DEGREE
+):
+    """
+    Post-extraction cleanup of a SimpleGraphStore `graph_dict` for querying:
+      1. generic entities ("本书", ...) are replaced by the book title, and
+         edges whose book cannot be found are dropped (they would only feed a hub)
+      2. aliases (see ALIASES_FILE) and near-duplicate names are merged
+         into one entity
+      3. each entity keeps at most `max_degree` outgoing edges, preferring
+         objects that lead further into the graph
+    Returns the refined graph_dict and a dict of statistics.
+    """
+    stats = Counter()
+
+    # 1. Generic entities
+    triplets = []
+    for subj, edges in graph_dict.items():
+        for rel, obj in edges:
+            triplet = (subj, rel, obj)
+            if subj in GENERIC_ENTITIES or obj in GENERIC_ENTITIES:
+                book_name = resolver.resolve(triplet) if resolver else None
+                if book_name is None:
+                    stats["generic_dropped"] += 1
+                    continue
+                triplet = rewrite_generic(triplet, book_name)
+                stats["generic_rewritten"] += 1
+            triplets.append(triplet)
+
+    # 2. Aliases & near-duplicates: the most frequent spelling wins
+    mentions = Counter()
+    for subj, _, obj in triplets:
+        mentions[subj] += 1
+        mentions[obj] += 1
+    aliases = {canonical_key(k): v for k, v in (aliases or {}).items()}
+    targets = {canonical_key(v): v for v in aliases.values()}
+    groups = defaultdict(list)
+    for name in mentions:
+        groups[canonical_key(aliases.get(canonical_key(name), name))].append(name)
+    canonical = {}
+    for key, names in groups.items():
+        # An explicit alias target wins over the most frequent spelling
+        winner = targets.get(key) or min(names, key=lambda n: (-mentions[n], len(n), n))
+        for name in names:
+            canonical[name] = winner
+        stats["entities_merged"] += len(names) - 1
+
+    merged = {}
+    for subj, rel, obj in triplets:
+        subj, obj = canonical[subj], canonical[obj]
+        if subj == obj:
+            stats["self_loops_dropped"] += 1
+            continue
+        edges = merged.setdefault(subj, {})
+        if (rel, obj) in edges:
+            stats["duplicate_edges_dropped"] += 1
+        edges[(rel, obj)] = None
+
+    # 3. Degree cap
+    out_degree = {subj: len(edges) for subj, edges in merged.items()}
+    refined = {}
+    for subj, edges in merged.items():
+        edges = list(edges)
+        if max_degree and len(edges) > max_degree:
+            stats["edges_pruned"] += len(edges) - max_degree
+            stats["nodes_capped"] += 1
+            order = sorted(range(len(edges)), key=lambda i: (-out_degree.get(edges[i][1], 0), i))
+            edges = [edges[i] for i in sorted(order[:max_degree])]
+        refined[subj] = [[rel, obj] for rel, obj in edges]
+    return refined, dict(stats)
+
+
+def degree_report(graph_dict: Dict[str, List[List[str]]], top: int = 10) -> dict:
+    """Out-degree distribution and largest hubs of a graph_dict."""
+    degrees = sorted((len(edges) for edges in graph_dict.values()), reverse=True)
+    buckets = {}
+    for low, high in DEGREE_BUCKETS:
+        label = f"{low}+" if high is None else (str(low) if low == high else f"{low}-{high}")
+        buckets[label] = sum(1 for d in degrees if d >= low and (high is None or d <= high))
+    hubs = sorted(graph_dict, key=lambda subj: -len(graph_dict[subj]))[:top]
+    return {
+        "subjects": len(degrees),
+        "edges": sum(degrees),
+        "max_degree": degrees[0] if degrees else 0,
+        "p99_degree": degrees[len(degrees) // 100] if degrees else 0,
+        "buckets": buckets,
+        "hubs": [(subj, len(graph_dict[subj])) for subj in hubs],
+    }
+
+
+def print_degree_report(before: dict, after: dict = None):
+    rows = [("", before)] if after is None else [("before", before), ("after", after)]
+    for label, report in rows:
+        prefix = f"{label:<6} " if label else ""
+        print(f">> [GRAPH] {prefix}{report['subjects']} subjects, {report['edges']} edges, "
+              f"max degree {report['max_degree']}, p99 {report['p99_degree']}")
+        print(f">> [GRAPH] {prefix}degree distribution: "
+              + ", ".join(f"{k}: {v}" for k, v in report["buckets"].items()))
+        print(f">> [GRAPH] {prefix}top hubs: "
+              + ", ".join(f"{subj} ({degree})" for subj, degree in report["hubs"]))
+
+
+def refine_persisted_graph(persist_dir: str, max_degree: int = MAX_NODE_DEGREE):
+    """
+    Refines `<persist_dir>/graph_store.json` and rewrites the compact graph
+    and entity index used by query.py. graph_store.json itself is left
+    untouched, incremental builds keep working from it.
+    The triplet vector index is built from the refined graph but needs the
+    embedding model: it is removed here, the next index.py run rebuilds it.
+    """
+    import shutil
+    from llama_index.core.storage.docstore import SimpleDocumentStore
+    from llama_index.core.storage.index_store import SimpleIndexStore
+
+    from src.entity_match import EntityMatcher
+    from src.graph_store import GRAPH_JSON_FILE, CompactGraphStore
+    from src.manifest import BuildManifest
+    from src.vector_index import VECTOR_INDEX_DIR
+
+    with open(os.path.join(persist_dir, GRAPH_JSON_FILE), "r", encoding="utf-8") as f:
+        graph_dict = json.load(f).get("graph_dict", {})
+    keyword_table = None
+    if os.path.exists(os.path.join(persist_dir, "index_store.json")):
+        keyword_table = SimpleIndexStore.from_persist_dir(persist_dir).index_structs()[0].table
+    resolver = BookNameResolver(
+        SimpleDocumentStore.from_persist_dir(persist_dir),
+        keyword_table,
+        BuildManifest.load(persist_dir).documents
+    )
+    refined, stats = refine_graph(graph_dict, resolver, load_aliases(persist_dir), max_degree)
+    CompactGraphStore.from_graph_dict(refined).save(persist_dir)
+    EntityMatcher.from_graph_dict(refined).save(persist_dir)
+    shutil.rmtree(os.path.join(persist_dir, VECTOR_INDEX_DIR), ignore_errors=True)
+    save_refine_inputs(persist_dir, max_degree)
+    return graph_dict, refined, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report on or refine the persisted knowledge graph.")
+    parser.add_argument("action", choices=["report", "refine"])
+    parser.add_argument("persist_dir", nargs="?", default="./storage_graph_csv")
+    parser.add_argument("--max-degree", type=int, default=MAX_NODE_DEGREE,
+                        help="Outgoing edges kept per entity (0 = no cap).")
+    args = parser.parse_args()
+
+    if args.action == "report":
+        # graph_store.json vs. the refined graph query.py actually traverses
+        from src.graph_store import GRAPH_JSON_FILE, CompactGraphStore, has_compact_graph
+        with open(os.path.join(args.persist_dir, GRAPH_JSON_FILE), "r", encoding="utf-8") as f:
+            raw = degree_report(json.load(f).get("graph_dict", {}))
+        refined = None
+        if has_compact_graph(args.persist_dir):
+            refined = degree_report(CompactGraphStore.from_persist_dir(args.persist_dir).to_graph_dict())
+        print_degree_report(raw, refined)
+    else:
+        raw, refined, stats = refine_persisted_graph(args.persist_dir, args.max_degree)
+        print_degree_report(degree_report(raw), degree_report(refined))
+        print(f">> [GRAPH] {stats}")
+        print(">> [GRAPH] Run 'python index.py' to rebuild the vector index from the refined graph.")
@@ -0,0 +1,293 @@
+import os
+import json
+import argparse
+import functools
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.graph_stores.types import GraphStore
+
+from src.array_store import load_arrays, save_arrays
+
+COMPACT_GRAPH_DIR = "graph_store_compact"
+GRAPH_JSON_FILE = "graph_store.json"
+# The compact store holds the refined query graph, graph_store.json the raw one
+COMPACT_JSON_FILE = "graph_store_compact.json"
+FORMAT_VERSION = 1
+ID_CACHE_SIZE = 4096  # Entity lookups remembered (names come from user queries)
+
+
+class CompactGraphStore(GraphStore):
+    """
+    Read-only graph store backed by memory-mapped NumPy arrays.
+
+    Entity and relation strings are interned once; edges are kept in a
+    CSR layout (`indptr` + per-edge relation/object IDs). Entities are
+    sorted by their UTF-8 bytes so a name is found by binary search over
+    the mapped string blob, without loading every entity into a dict.
+    Only the pages actually touched by a query are read from disk.
+    """
+
+    def __init__(self, entity_offsets, entity_blob, relations, indptr, edge_rel, edge_obj):
+        self._offsets = entity_offsets     # int64[n + 1], byte offsets into entity_blob
+        self._blob = entity_blob           # uint8[...], UTF-8 entity names, sorted
+        self._relations = relations        # list[str], relation ID -> name
+        self._indptr = indptr              # int64[n + 1], edges of entity i: indptr[i]:indptr[i+1]
+        self._edge_rel = edge_rel          # int32[m], relation ID of each edge
+        self._edge_obj = edge_obj          # int32[m], object entity ID of each edge
+        # Bounded: in KEYWORD_MODE="llm" the looked-up names are arbitrary query strings
+        self._lookup = functools.lru_cache(maxsize=ID_CACHE_SIZE)(self._find_entity)
+
+    # ------------------------------------------------------------------
+    # Construction / persistence
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_graph_dict(cls, graph_dict: Dict[str, List[List[str]]]) -> "CompactGraphStore":
+        """Builds the arrays from a SimpleGraphStore `graph_dict`."""
+        names = set(graph_dict)
+        for edges in graph_dict.values():
+            names.update(obj for _, obj in edges)
+        entities = sorted(name.encode("utf-8") for name in names)
+        entity_ids = {name.decode("utf-8"): i for i, name in enumerate(entities)}
+
+        relations = sorted({rel for edges in graph_dict.values() for rel, _ in edges})
+        relation_ids = {rel: i for i, rel in enumerate(relations)}
+
+        degrees = np.zeros(len(entities), dtype=np.int64)
+        for subj, edges in graph_dict.items():
+            degrees[entity_ids[subj]] = len(edges)
+        indptr = np.zeros(len(entities) + 1, dtype=np.int64)
+        np.cumsum(degrees, out=indptr[1:])
+
+        # Edges keep their original order within a subject, like graph_dict
+        edge_rel = np.empty(indptr[-1], dtype=np.int32)
+        edge_obj = np.empty(indptr[-1], dtype=np.int32)
+        for subj, edges in graph_dict.items():
+            start = indptr[entity_ids[subj]]
+            for k, (rel, obj) in enumerate(edges):
+                edge_rel[start + k] = relation_ids[rel]
+                edge_obj[start + k] = entity_ids[obj]
+
+        offsets = np.zeros(len(entities) + 1, dtype=np.int64)
+        np.cumsum([len(name) for name in entities], out=offsets[1:])
+        blob = np.frombuffer(b"".join(entities), dtype=np.uint8)
+        return cls(offsets, blob, relations, indptr, edge_rel, edge_obj)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "CompactGraphStore":
+        """Memory-maps a graph saved with `save()`."""
+        meta, arrays = load_arrays(
+            os.path.join(persist_dir, COMPACT_GRAPH_DIR), FORMAT_VERSION
+        )
+        return cls(
+            arrays["entity_offsets"],
+            arrays["entity_blob"],
+            meta["relations"],
+            arrays["indptr"],
+            arrays["edge_rel"],
+            arrays["edge_obj"],
+        )
+
+    def save(self, persist_dir: str):
+        """
+        Writes the arrays under `<persist_dir>/graph_store_compact/`. Safe while
+        other processes have the previous graph mapped (see src/array_store.py).
+        """
+        save_arrays(os.path.join(persist_dir, COMPACT_GRAPH_DIR), {
+            "entity_offsets": self._offsets,
+            "entity_blob": self._blob,
+            "indptr": self._indptr,
+            "edge_rel": self._edge_rel,
+            "edge_obj": self._edge_obj,
+        }, {
+            "version": FORMAT_VERSION,
+            "num_entities": self.num_entities,
+            "num_edges": self.num_edges,
+            "relations": self._relations,
+        })
+
+    def to_graph_dict(self) -> Dict[str, List[List[str]]]:
+        """Converts back to the SimpleGraphStore `graph_dict` layout."""
+        graph_dict = {}
+        for eid in range(self.num_entities):
+            if self._indptr[eid + 1] > self._indptr[eid]:
+                graph_dict[self._entity_name(eid)] = [
+                    [rel, obj] for rel, obj in self._edges(eid)
+                ]
+        return graph_dict
+
+    # ------------------------------------------------------------------
+    # Lookups
+    # ------------------------------------------------------------------
+    @property
+    def num_entities(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def num_edges(self) -> int:
+        return len(self._edge_rel)
+
+    def _entity_bytes(self, eid: int) -> bytes:
+        return self._blob[self._offsets[eid]:self._offsets[eid + 1]].tobytes()
+
+    def _entity_name(self, eid: int) -> str:
+        return self._entity_bytes(eid).decode("utf-8")
+
+    def entity_id(self, name: str) -> Optional[int]:
+        """Entity ID of `name`, None when it is not in the graph."""
+        return self._lookup(name)
+
+    def _find_entity(self, name: str) -> Optional[int]:
+        """Binary search over the sorted entity names."""
+        key = name.encode("utf-8")
+        lo, hi = 0, self.num_entities
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._entity_bytes(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.num_entities and self._entity_bytes(lo) == key else None
+
+    def _edges(self, eid: int, limit: int = None):
+        start, end = int(self._indptr[eid]), int(self._indptr[eid + 1])
+        if limit is not None:
+            end = min(end, start + limit)
+        rels = self._edge_rel[start:end].tolist()
+        objs = self._edge_obj[start:end].tolist()
+        return [(self._relations[r], self._entity_name(o)) for r, o in zip(rels, objs)]
+
+    def neighbors(self, entity: str, limit: int = None):
+        """Outgoing (relation, object) pairs of an entity, the first `limit` only if given."""
+        eid = self.entity_id(entity)
+        return [] if eid is None else self._edges(eid, limit)
+
+    def degree(self, entity: str) -> int:
+        eid = self.entity_id(entity)
+        return 0 if eid is None else int(self._indptr[eid + 1] - self._indptr[eid])
+
+    def expand(self, entities: List[str], depth: int = 2, max_edges: int = 100):
+        """
+        Depth-limited breadth-first expansion around `entities`.
+        Returns up to `max_edges` (subject, relation, object) triplets; each
+        entity is expanded at most once.
+        """
+        triplets = []
+        visited = set()
+        queue = deque((entity, 0) for entity in entities)
+        while queue and len(triplets) < max_edges:
+            entity, level = queue.popleft()
+            if entity in visited or level >= depth:
+                continue
+            visited.add(entity)
+            for rel, obj in self.neighbors(entity):
+                triplets.append((entity, rel, obj))
+                if len(triplets) >= max_edges:
+                    break
+                queue.append((obj, level + 1))
+        return triplets
+
+    # ------------------------------------------------------------------
+    # GraphStore protocol (used by KGTableRetriever)
+    # ------------------------------------------------------------------
+    @property
+    def client(self) -> None:
+        return
+
+    def get(self, subj: str) -> List[List[str]]:
+        return [[rel, obj] for rel, obj in self.neighbors(subj)]
+
+    def get_rel_map(
+        self, subjs: Optional[List[str]] = None, depth: int = 2, limit: int = 30
+    ) -> Dict[str, List[List[str]]]:
+        """Same output and truncation rules as SimpleGraphStore.get_rel_map."""
+        if subjs is None:
+            subjs = [self._entity_name(eid) for eid in range(self.num_entities)]
+
+        rel_count = 0
+        return_map = {}
+        for subj in subjs:
+            # Expanding one path more than still fits is enough to detect the
+            # truncation below, so hubs are never walked past the limit.
+            rel_map = self._get_rel_map(subj, depth=depth, limit=limit,
+                                        max_paths=limit - rel_count + 1)
+            if rel_count + len(rel_map) > limit:
+                return_map[subj] = rel_map[: limit - rel_count]
+                break
+            return_map[subj] = rel_map
+            rel_count += len(rel_map)
+        return return_map
+
+    def _get_rel_map(self, subj: str, depth: int = 2, limit: int = 30,
+                     max_paths: int = None) -> List[List[str]]:
+        """Same depth-first order as SimpleGraphStore, stopped after `max_paths` paths."""
+        if depth == 0 or (max_paths is not None and max_paths <= 0):
+            return []
+        rel_map = []
+        for rel, obj in self.neighbors(subj, limit):
+            if max_paths is not None and len(rel_map) >= max_paths:
+                break
+            rel_map.append([subj, rel, obj])
+            remaining = None if max_paths is None else max_paths - len(rel_map)
+            rel_map += self._get_rel_map(obj, depth=depth - 1, max_paths=remaining)
+        return rel_map
+
+    def upsert_triplet(self, subj: str, rel: str, obj: str) -> None:
+        raise NotImplementedError("CompactGraphStore is read-only, rebuild it with index.py.")
+
+    def delete(self, subj: str, rel: str, obj: str) -> None:
+        raise NotImplementedError("CompactGraphStore is read-only, rebuild it with index.py.")
+
+    def persist(self, persist_path: str, fs=None) -> None:
+        """Called by StorageContext.persist with the graph_store.json path."""
+        self.save(os.path.dirname(persist_path))
+
+    def get_schema(self, refresh: bool = False) -> str:
+        raise NotImplementedError("CompactGraphStore does not support get_schema")
+
+    def query(self, query: str, param_map: Optional[Dict[str, Any]] = {}) -> Any:
+        raise NotImplementedError("CompactGraphStore does not support query")
+
+
+def has_compact_graph(persist_dir: str) -> bool:
+    return os.path.exists(os.path.join(persist_dir, COMPACT_GRAPH_DIR, "meta.json"))
+
+
+def graph_json_to_compact(persist_dir: str) -> CompactGraphStore:
+    """Converts `<persist_dir>/graph_store.json` into the compact format."""
+    with open(os.path.join(persist_dir, GRAPH_JSON_FILE), "r", encoding="utf-8") as f:
+        graph_dict = json.load(f).get("graph_dict", {})
+    store = CompactGraphStore.from_graph_dict(graph_dict)
+    store.save(persist_dir)
+    return store
+
+
+def compact_to_graph_json(persist_dir: str) -> str:
+    """
+    Exports the compact graph as `<persist_dir>/graph_store_compact.json`
+    (SimpleGraphStore layout). graph_store.json is never overwritten: it
+    holds every extracted triplet and must keep matching build_manifest.json,
+    while the compact graph is the refined, lossy query graph.
+    """
+    store = CompactGraphStore.from_persist_dir(persist_dir)
+    path = os.path.join(persist_dir, COMPACT_JSON_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"graph_dict": store.to_graph_dict()}, f, ensure_ascii=False)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert graph_store.json to the compact graph format, "
+                                                 "or export the compact graph as JSON.")
+    parser.add_argument("direction", choices=["to-compact", "to-json"])
+    parser.add_argument("persist_dir", nargs="?", default="./storage_graph_csv")
+    args = parser.parse_args()
+
+    if args.direction == "to-compact":
+        store = graph_json_to_compact(args.persist_dir)
+        print(f">> [GRAPH] {store.num_entities} entities, {store.num_edges} edges "
+              f"written to '{os.path.join(args.persist_dir, COMPACT_GRAPH_DIR)}'.")
+    else:
+        path = compact_to_graph_json(args.persist_dir)
+        print(f">> [GRAPH] Compact graph exported to '{path}' ('{GRAPH_JSON_FILE}' is left untouched).")
@@ -2,37 +2,102 @@ import os
 import pandas as pd
 from llama_index.core import Document
 
-def load_documents_from_csv(file_path: str):
+CSV_CHUNK_SIZE = 10000  # Rows parsed per pandas chunk
+CSV_COLUMNS = ["book_id", "book_name", "book_summary"]
+
+
+def _make_document(book_id: str, book_name, book_summary) -> Document:
+    # pandas gives NaN for an empty title, which would end up as a float entity
+    if not isinstance(book_name, str):
+        book_name = ""
+
+    # CRITICAL TRICK: We inject the title directly into the text body.
+    # This ensures the LLM 'sees' the title immediately when reading the chunk,
+    # preventing it from getting lost in metadata.
+    text_content = (
+        f"BOOK TITLE: {book_name}\n"
+        f"SOURCE ID: {book_id}\n"
+        f"SUMMARY:\n{book_summary}"
+    )
+
+    # We still keep metadata for system-level filtering if needed later
+    metadata = {
+        'book_name': book_name,
+        'book_id': book_id
+    }
+
+    # Stable ID derived from book_id (instead of a random UUID) so that
+    # incremental builds can recognise the same book across runs.
+    return Document(
+        id_=f"book-{book_id}",
+        text=text_content,
+        metadata=metadata
+    )
+
+
+def iter_documents_from_csv(file_path: str, chunksize: int = CSV_CHUNK_SIZE, verbose: bool = True):
     """
-    Reads a CSV file and converts it into LlamaIndex Document objects.
+    Streams a CSV file and lazily yields LlamaIndex Document objects.
+    Only `chunksize` rows are held in memory at a time. Rows with an empty
+    book_id or summary are skipped, and only the first row of each book_id is kept.
+    IDs are read as strings ("007" and "7" are different books), so pandas
+    cannot infer a different type per chunk.
     Expects columns: book_id, book_name, book_summary.
     """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File {file_path} not found.")
-    
-    print(f">> [LOADER] Reading CSV file: {file_path}")
-    df = pd.read_csv(file_path)
-    
-    documents = []
-    # Iterate over each row to create a clean Document object
-    for _, row in df.iterrows():
-        # CRITICAL TRICK: We inject the title directly into the text body.
-        # This ensures the LLM 'sees' the title immediately when reading the chunk,
-        # preventing it from getting lost in metadata.
-        text_content = (
-            f"BOOK TITLE: {row['book_name']}\n"
-            f"SOURCE ID: {row['book_id']}\n"
-            f"SUMMARY:\n{row['book_summary']}"
-        )
-        
-        # We still keep metadata for system-level filtering if needed later
-        metadata = {
-            'book_name': row['book_name'],
-            'book_id': str(row['book_id'])
-        }
-        
-        doc = Document(text=text_content, metadata=metadata)
-        documents.append(doc)
-    
-    print(f">> [LOADER] {len(documents)} books loaded with embedded titles.")
-    return documents
\ No newline at end of file
+
+    if verbose:
+        print(f">> [LOADER] Streaming CSV file: {file_path}")
+
+    seen_ids = set()
+    loaded = skipped_no_id = skipped_empty = skipped_duplicates = 0
+    reader = pd.read_csv(file_path, usecols=CSV_COLUMNS, dtype=str, chunksize=chunksize)
+    for chunk in reader:
+        # Drop NaN / blank IDs, they would all collapse into one "nan" book
+        book_ids = chunk["book_id"].str.strip()
+        has_id = book_ids.notna() & (book_ids != "")
+        skipped_no_id += int((~has_id).sum())
+        chunk = chunk[has_id].assign(book_id=book_ids[has_id])
+
+        # Drop NaN / blank summaries for the whole chunk at once
+        summaries = chunk["book_summary"].str.strip()
+        has_summary = summaries.notna() & (summaries != "")
+        skipped_empty += int((~has_summary).sum())
+        chunk = chunk[has_summary]
+
+        # Plain column iteration is far cheaper than df.iterrows()
+        for book_id, book_name, book_summary in zip(
+            chunk["book_id"], chunk["book_name"], chunk["book_summary"]
+        ):
+            if book_id in seen_ids:
+                skipped_duplicates += 1
+                continue
+            seen_ids.add(book_id)
+            loaded += 1
+            yield _make_document(book_id, book_name, book_summary)
+
+    if verbose:
+        print(f">> [LOADER] {loaded} books loaded with embedded titles ({skipped_no_id} without book_id, "
+              f"{skipped_empty} without summary, {skipped_duplicates} duplicates skipped).")
+
+
+def iter_document_batches(documents, batch_size: int):
+    """Groups any iterable of Documents into lists of at most `batch_size`."""
+    batch = []
+    for doc in documents:
+        batch.append(doc)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def load_documents_from_csv(file_path: str):
+    """
+    Reads a CSV file and converts it into LlamaIndex Document objects.
+    Expects columns: book_id, book_name, book_summary.
+    Prefer iter_documents_from_csv for large catalogs.
+    """
+    return list(iter_documents_from_csv(file_path))
@@ -0,0 +1,68 @@
+import json
+import os
+
+MANIFEST_FILE = "build_manifest.json"
+MANIFEST_VERSION = 1
+
+
+class BuildManifest:
+    """
+    Records, for every indexed book, the content hash it was built from and
+    the triplets DeepSeek extracted for it.
+    This is what lets index.py skip unchanged rows and drop the triplets
+    of rows that disappeared from the CSV.
+    """
+
+    def __init__(self, persist_dir: str, documents: dict = None):
+        self.path = os.path.join(persist_dir, MANIFEST_FILE)
+        # doc_id -> {"hash": str, "triplets": [[subj, rel, obj], ...]}
+        self.documents = documents or {}
+
+    @classmethod
+    def load(cls, persist_dir: str):
+        """Loads the manifest from disk, or returns an empty one."""
+        path = os.path.join(persist_dir, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return cls(persist_dir)
+
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        if data.get("version") != MANIFEST_VERSION:
+            print(f">> [MANIFEST] Unsupported manifest version in {path}, ignoring it.")
+            return cls(persist_dir)
+        return cls(persist_dir, data.get("documents", {}))
+
+    def __len__(self):
+        return len(self.documents)
+
+    def is_current(self, doc_id: str, doc_hash: str) -> bool:
+        """True if this document was already indexed with the same content."""
+        entry = self.documents.get(doc_id)
+        return entry is not None and entry["hash"] == doc_hash
+
+    def record(self, doc_id: str, doc_hash: str, triplets):
+        self.documents[doc_id] = {
+            "hash": doc_hash,
+            "triplets": [list(t) for t in triplets],
+        }
+
+    def forget(self, doc_id: str):
+        """Removes a document and returns the triplets it contributed."""
+        entry = self.documents.pop(doc_id, None)
+        return [tuple(t) for t in entry["triplets"]] if entry else []
+
+    def referenced_triplets(self) -> set:
+        """All triplets still contributed by at least one document."""
+        triplets = set()
+        for entry in self.documents.values():
+            triplets.update(tuple(t) for t in entry["triplets"])
+        return triplets
+
+    def save(self):
+        """Writes the manifest atomically so a crash never leaves it half-written."""
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "documents": self.documents}, f)
+        os.replace(tmp_path, self.path)
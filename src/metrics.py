@@ -0,0 +1,112 @@
+import json
+import time
+import random
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+MAX_SAMPLES = 10000  # Samples kept per metric for percentiles (reservoir sampling)
+PERCENTILES = (50, 90, 95, 99)
+
+
+class _Series:
+    """Count, total and a bounded random sample of one measured quantity."""
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = float("-inf")
+        self.samples = []
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        if len(self.samples) < MAX_SAMPLES:
+            self.samples.append(value)
+        else:
+            slot = random.randrange(self.count)
+            if slot < MAX_SAMPLES:
+                self.samples[slot] = value
+
+    def summary(self) -> dict:
+        ordered = sorted(self.samples)
+        result = {"count": self.count, "total": self.total,
+                  "mean": self.total / self.count, "max": self.max}
+        for p in PERCENTILES:
+            # Nearest-rank percentile
+            rank = max(0, min(len(ordered) - 1, -(-p * len(ordered) // 100) - 1))
+            result[f"p{p}"] = ordered[rank]
+        return result
+
+
+class Metrics:
+    """
+    Thread-safe registry of stage timings (seconds), observed values
+    (batch sizes, nodes visited, ...) and counters (tokens, documents, ...).
+
+        with METRICS.timer("build.extract"):
+            ...
+        METRICS.observe("embed.batch_size", len(texts))
+        METRICS.count("llm.tokens_in", prompt_tokens)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timings = defaultdict(_Series)
+        self._values = defaultdict(_Series)
+        self._counters = defaultdict(float)
+
+    @contextmanager
+    def timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_time(stage, time.perf_counter() - start)
+
+    def record_time(self, stage: str, seconds: float):
+        with self._lock:
+            self._timings[stage].add(seconds)
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self._values[name].add(value)
+
+    def count(self, name: str, amount: float = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._values.clear()
+            self._counters.clear()
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "timings": {name: s.summary() for name, s in sorted(self._timings.items())},
+                "values": {name: s.summary() for name, s in sorted(self._values.items())},
+                "counters": dict(sorted(self._counters.items())),
+            }
+
+    def export(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+
+    def report(self):
+        """Prints a one-line-per-metric summary to the console."""
+        summary = self.summary()
+        for name, s in summary["timings"].items():
+            print(f">> [METRICS] {name:<28} n={s['count']:<6} total={s['total']:.3f}s "
+                  f"p50={s['p50'] * 1000:.1f}ms p95={s['p95'] * 1000:.1f}ms max={s['max'] * 1000:.1f}ms")
+        for name, s in summary["values"].items():
+            print(f">> [METRICS] {name:<28} n={s['count']:<6} mean={s['mean']:.1f} "
+                  f"p50={s['p50']:g} p95={s['p95']:g} max={s['max']:g}")
+        for name, value in summary["counters"].items():
+            print(f">> [METRICS] {name:<28} {value:g}")
+
+
+# Process-wide registry used by index.py, query.py and server.py
+METRICS = Metrics()
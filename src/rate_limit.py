@@ -0,0 +1,47 @@
+import time
+import asyncio
+
+
+class TokenBucket:
+    """
+    Async token bucket refilled continuously at `rate_per_minute`.
+    Used both for requests per minute (1 unit per call) and for
+    tokens per minute (estimated prompt + completion tokens).
+
+    A bucket can be shared by successive asyncio.run() calls, so a limit
+    holds across batches: the lock is recreated for each event loop.
+    """
+
+    def __init__(self, rate_per_minute: float):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive.")
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0  # Units per second
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = None
+        self._loop = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0):
+        """Waits until `amount` units are available, then takes them."""
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._lock, self._loop = asyncio.Lock(), loop
+        async with self._lock:
+            self._refill()
+            while self._tokens < amount:
+                await asyncio.sleep((amount - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= amount
+
+    def charge(self, amount: float):
+        """Takes units without waiting (e.g. completion tokens known only afterwards)."""
+        self._refill()
+        self._tokens -= amount
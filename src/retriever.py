@@ -0,0 +1,169 @@
+import time
+import logging
+from collections import defaultdict
+from typing import List
+
+from llama_index.core.indices.knowledge_graph.retrievers import (
+    DEFAULT_NODE_SCORE,
+    GLOBAL_EXPLORE_NODE_LIMIT,
+    KGRetrieverMode,
+    KGTableRetriever,
+)
+from llama_index.core.schema import NodeWithScore, QueryBundle, TextNode
+from llama_index.core.utils import print_text
+
+from src.entity_match import EntityMatcher
+from src.metrics import METRICS
+from src.vector_index import VectorIndex
+
+logger = logging.getLogger(__name__)
+
+REL_MAP_LIMIT = 30  # Paths per keyword, the default of GraphStore.get_rel_map
+
+
+class GraphRetriever(KGTableRetriever):
+    """
+    KGTableRetriever with the same keyword + graph logic, but whose
+    embedding half runs on a VectorIndex (one matrix product for the
+    top-k) instead of scoring every triplet of `embedding_dict` in Python.
+    The mode is KGTableRetriever's `retriever_mode` (KEYWORD by default),
+    the vector index is only searched in HYBRID or EMBEDDING mode.
+    A precomputed `query_bundle.embedding` is used as-is when present;
+    otherwise the query is embedded only when the vector index is actually
+    searched, through `query_embedder` (text -> vector, e.g. server.py's
+    batcher) if set, else the embed model.
+
+    With an `entity_matcher`, query keywords are the graph entities found
+    in the query text locally, which saves the LLM keyword-extraction call.
+
+    `max_query_edges` bounds the graph paths expanded for one query over
+    all its keywords (each keyword is still limited to REL_MAP_LIMIT).
+    """
+
+    def __init__(self, index, vector_index: VectorIndex = None,
+                 entity_matcher: EntityMatcher = None, max_query_edges: int = None,
+                 query_embedder=None, **kwargs):
+        if vector_index is None and index.index_struct.embedding_dict:
+            embedding_dict = index.index_struct.embedding_dict
+            vector_index = VectorIndex.from_embeddings(
+                list(embedding_dict), list(embedding_dict.values())
+            )
+        super().__init__(index, **kwargs)
+        self._vector_index = vector_index
+        self._entity_matcher = entity_matcher
+        self._max_query_edges = max_query_edges
+        self.query_embedder = query_embedder
+
+    def _get_keywords(self, query_str: str) -> List[str]:
+        if self._entity_matcher is None:
+            return super()._get_keywords(query_str)
+        return self._entity_matcher.match(query_str, max_entities=self.max_keywords_per_query)
+
+    def _retrieve_rel_texts(self, query_bundle: QueryBundle):
+        """Triplets found from the query keywords (graph) and embedding (vector index)."""
+        node_visited = set()
+        with METRICS.timer("query.keywords"):
+            keywords = self._get_keywords(query_bundle.query_str)
+        if self._verbose:
+            print_text(f"Extracted keywords: {keywords}\n", color="green")
+
+        rel_texts = []
+        cur_rel_map = {}
+        chunk_indices_count = defaultdict(int)
+        graph_start = time.perf_counter()
+        graph_paths = 0
+        if self._retriever_mode != KGRetrieverMode.EMBEDDING:
+            for keyword in keywords:
+                node_ids = self._index_struct.search_node_by_keyword(keyword)
+                for node_id in node_ids[:GLOBAL_EXPLORE_NODE_LIMIT]:
+                    if node_id in node_visited:
+                        continue
+                    if self._include_text:
+                        chunk_indices_count[node_id] += 1
+                    node_visited.add(node_id)
+
+                limit = REL_MAP_LIMIT
+                if self._max_query_edges is not None:
+                    limit = min(limit, self._max_query_edges - graph_paths)
+                if limit <= 0:
+                    continue
+                rel_map = self._graph_store.get_rel_map(
+                    [keyword], self.graph_store_query_depth, limit=limit
+                )
+                if not rel_map:
+                    continue
+                graph_paths += sum(len(rel_objs) for rel_objs in rel_map.values())
+                rel_texts.extend(
+                    str(rel_obj) for rel_objs in rel_map.values() for rel_obj in rel_objs
+                )
+                cur_rel_map.update(rel_map)
+        METRICS.record_time("query.graph_traversal", time.perf_counter() - graph_start)
+        METRICS.observe("query.graph_nodes_visited", len({
+            entity for paths in cur_rel_map.values() for path in paths for entity in path[::2]
+        }))
+
+        if self._retriever_mode != KGRetrieverMode.KEYWORD and self._vector_index:
+            query_embedding = query_bundle.embedding
+            if query_embedding is None:
+                embed = self.query_embedder or self._embed_model.get_query_embedding
+                with METRICS.timer("query.embed"):
+                    query_embedding = embed(query_bundle.query_str)
+            with METRICS.timer("query.vector_search"):
+                hits = self._vector_index.search(query_embedding, self.similarity_top_k)
+            logger.debug(f"Found the following top_k rel_texts: {hits}")
+            rel_texts.extend(rel_text for rel_text, _ in hits)
+
+        return rel_texts, cur_rel_map, chunk_indices_count
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        rel_texts, cur_rel_map, chunk_indices_count = self._retrieve_rel_texts(query_bundle)
+
+        # Remove duplicates from keyword + embedding queries (as KGTableRetriever)
+        if self._retriever_mode == KGRetrieverMode.HYBRID:
+            rel_texts = list(set(rel_texts))
+            rel_texts.sort(key=len, reverse=True)
+            for i in range(len(rel_texts)):
+                for j in range(i + 1, len(rel_texts)):
+                    if rel_texts[j] in rel_texts[i]:
+                        rel_texts[j] = ""
+            rel_texts = [rel_text for rel_text in rel_texts if rel_text != ""]
+            rel_texts = rel_texts[: self.max_knowledge_sequence]
+
+        # Text chunks of every entity that appears in a retrieved triplet
+        if self._include_text:
+            for keyword in self._extract_rel_text_keywords(rel_texts):
+                for node_id in self._index_struct.search_node_by_keyword(keyword):
+                    chunk_indices_count[node_id] += 1
+
+        METRICS.observe("query.chunks_retrieved", min(len(chunk_indices_count), self.num_chunks_per_query))
+        sorted_chunk_indices = sorted(
+            chunk_indices_count, key=lambda x: chunk_indices_count[x], reverse=True
+        )[: self.num_chunks_per_query]
+        nodes_with_scores = [
+            NodeWithScore(node=node, score=DEFAULT_NODE_SCORE)
+            for node in self._docstore.get_nodes(sorted_chunk_indices)
+        ]
+
+        if not rel_texts:
+            if not nodes_with_scores:
+                return [NodeWithScore(node=TextNode(text="No relationships found."), score=1.0)]
+            return nodes_with_scores
+
+        rel_initial_text = (
+            f"The following are knowledge sequence in max depth"
+            f" {self.graph_store_query_depth} "
+            f"in the form of directed graph like:\n"
+            f"`subject -[predicate]->, object, <-[predicate_next_hop]-,"
+            f" object_next_hop ...`"
+        )
+        rel_info_text = "\n".join([rel_initial_text, *rel_texts])
+        if self._verbose:
+            print_text(f"KG context:\n{rel_info_text}\n", color="blue")
+        rel_text_node = TextNode(
+            text=rel_info_text,
+            metadata={"kg_rel_texts": rel_texts, "kg_rel_map": cur_rel_map},
+            excluded_embed_metadata_keys=["kg_rel_map", "kg_rel_texts"],
+            excluded_llm_metadata_keys=["kg_rel_map", "kg_rel_texts"],
+        )
+        nodes_with_scores.append(NodeWithScore(node=rel_text_node, score=DEFAULT_NODE_SCORE))
+        return nodes_with_scores
@@ -0,0 +1,17 @@
+import re
+
+# CJK characters are roughly one token each for DeepSeek's tokenizer,
+# Latin text is closer to four characters per token.
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheap token estimate used for rate limiting and budgets.
+    Avoids loading a tokenizer for a number that only needs to be close.
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
@@ -0,0 +1,115 @@
+import os
+import json
+from typing import List, Optional
+
+import numpy as np
+
+from src.array_store import load_arrays, save_arrays
+
+VECTOR_INDEX_DIR = "vector_index"
+FORMAT_VERSION = 1
+SEARCH_BLOCK_ROWS = 65536  # Rows scored per block, bounds temporary memory
+DTYPES = ("float32", "float16", "int8")
+
+
+class VectorIndex:
+    """
+    Embedding matrix saved as a .npy file and memory-mapped at load time.
+    Rows are L2-normalised, so cosine similarity is a plain dot product
+    and top-k for a whole batch of queries is one matrix multiplication.
+
+    dtype "float16" halves the file size; "int8" quarters it using one
+    scale factor per row.
+    """
+
+    def __init__(self, ids: List[str], vectors, scales=None):
+        self.ids = ids
+        self._vectors = vectors
+        self._scales = scales  # float32[n], only for int8
+
+    @classmethod
+    def from_embeddings(cls, ids: List[str], embeddings, dtype: str = "float32") -> "VectorIndex":
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype must be one of {DTYPES}, got '{dtype}'.")
+
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if len(ids) == 0:
+            matrix = matrix.reshape(0, matrix.shape[-1] if matrix.ndim == 2 else 0)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1.0, norms)
+
+        if dtype == "int8":
+            max_abs = np.abs(matrix).max(axis=1) if len(ids) else np.zeros(0, dtype=np.float32)
+            scales = (np.where(max_abs == 0, 1.0, max_abs) / 127.0).astype(np.float32)
+            vectors = np.round(matrix / scales[:, None]).astype(np.int8)
+            return cls(list(ids), vectors, scales)
+        return cls(list(ids), matrix.astype(dtype))
+
+    @classmethod
+    def load(cls, persist_dir: str) -> "VectorIndex":
+        # ids and vectors come from the same save, even during a concurrent rebuild
+        meta, arrays = load_arrays(os.path.join(persist_dir, VECTOR_INDEX_DIR), FORMAT_VERSION)
+        return cls(meta["ids"], arrays["vectors"], arrays.get("scales"))
+
+    def save(self, persist_dir: str):
+        """Safe while other processes have the previous index mapped (see src/array_store.py)."""
+        arrays = {"vectors": self._vectors}
+        if self._scales is not None:
+            arrays["scales"] = self._scales
+        save_arrays(os.path.join(persist_dir, VECTOR_INDEX_DIR), arrays, {
+            "version": FORMAT_VERSION,
+            "dtype": str(self._vectors.dtype),
+            "count": len(self.ids),
+            "ids": self.ids,
+        })
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, queries, top_k: int = 5):
+        """
+        Returns, for each query, the top_k (id, cosine similarity) pairs.
+        Accepts one query vector or a (batch, dim) matrix.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        single = queries.ndim == 1
+        queries = np.atleast_2d(queries)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms == 0, 1.0, norms)
+
+        top_k = min(top_k, len(self.ids))
+        if top_k == 0:
+            return [] if single else [[] for _ in queries]
+
+        scores = np.empty((len(queries), len(self.ids)), dtype=np.float32)
+        for start in range(0, len(self.ids), SEARCH_BLOCK_ROWS):
+            block = np.asarray(self._vectors[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            block_scores = queries @ block.T
+            if self._scales is not None:
+                block_scores *= self._scales[start:start + SEARCH_BLOCK_ROWS]
+            scores[:, start:start + len(block)] = block_scores
+
+        # argpartition finds the top_k in linear time, only those get sorted
+        top = np.argpartition(-scores, top_k - 1, axis=1)[:, :top_k]
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        results = [
+            [(self.ids[i], float(s)) for i, s in zip(row_ids, row_scores)]
+            for row_ids, row_scores in zip(top.tolist(), top_scores.tolist())
+        ]
+        return results[0] if single else results
+
+
+def saved_dtype(persist_dir: str) -> Optional[str]:
+    """dtype of the saved vector index, None when there is none."""
+    if not has_vector_index(persist_dir):
+        return None
+    with open(os.path.join(persist_dir, VECTOR_INDEX_DIR, "meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)["dtype"]
+
+
+def has_vector_index(persist_dir: str) -> bool:
+    return os.path.exists(os.path.join(persist_dir, VECTOR_INDEX_DIR, "meta.json"))
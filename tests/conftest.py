@@ -0,0 +1,55 @@
+import os
+import sys
+import csv
+
+import pytest
+from llama_index.core import Settings
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.embeddings import CachedEmbedding, EmbeddingCache  # noqa: E402
+from src.fakes import FakeLLM, FakeEmbedding  # noqa: E402
+from src.loader import CSV_COLUMNS  # noqa: E402
+
+
+@pytest.fixture
+def fake_models(tmp_path):
+    """Puts FakeLLM / FakeEmbedding on Settings, restores the previous models afterwards."""
+    saved = Settings._llm, Settings._embed_model
+    Settings.llm = FakeLLM(delay=0)
+    Settings.embed_model = CachedEmbedding(FakeEmbedding(delay=0),
+                                           EmbeddingCache(str(tmp_path / "embeddings.sqlite")))
+    yield Settings.llm, Settings.embed_model
+    Settings._llm, Settings._embed_model = saved
+
+
+def write_books(path, books):
+    """Writes a catalog CSV from {book_id: (book_name, book_summary)}."""
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_COLUMNS)
+        for book_id, (name, summary) in books.items():
+            writer.writerow([book_id, name, summary])
+
+
+@pytest.fixture
+def build_index(tmp_path, monkeypatch, fake_models):
+    """
+    Returns build(books, **kwargs): writes the catalog and runs index.build_graph
+    with the fake models on a temporary PERSIST_DIR.
+    """
+    pytest.importorskip("llama_index.embeddings.huggingface")
+    import index
+
+    persist_dir = str(tmp_path / "storage")
+    data_file = str(tmp_path / "books.csv")
+    monkeypatch.setattr(index, "PERSIST_DIR", persist_dir)
+    monkeypatch.setattr(index, "DATA_FILE", data_file)
+
+    def build(books, **kwargs):
+        write_books(data_file, books)
+        index.build_graph(init_models=False, **kwargs)
+        return persist_dir
+
+    return build
+
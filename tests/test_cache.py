@@ -0,0 +1,64 @@
+import pytest
+
+from src import cache
+from src.cache import DiskCacheBackend, LRUCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    lru = LRUCache(max_size=2, ttl=60)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    assert lru.get("a") == 1      # "b" is now the least recently used
+    lru.set("c", 3)
+
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert len(lru) == 2
+
+
+def test_entries_expire_after_ttl(clock):
+    lru = LRUCache(max_size=10, ttl=60)
+    lru.set("a", 1)
+    clock.now += 59
+    assert lru.get("a") == 1
+    clock.now += 2
+
+    assert lru.get("a") is None
+    assert len(lru) == 0
+    assert lru.stats()["hits"] == 1 and lru.stats()["misses"] == 1
+
+
+def test_disk_entries_keep_their_expiry(clock, tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    LRUCache(ttl=60, disk=DiskCacheBackend(path, "answers", 10)).set("a", {"answer": 1})
+    clock.now += 30
+
+    restarted = LRUCache(ttl=60, disk=DiskCacheBackend(path, "answers", 10))
+    assert restarted.get("a") == {"answer": 1}
+    clock.now += 31
+    assert restarted.get("a") is None
+
+
+def test_disk_backend_caps_its_size(clock, tmp_path):
+    disk = DiskCacheBackend(str(tmp_path / "cache.sqlite"), "answers", 2)
+    for i, key in enumerate("abc"):
+        clock.now += 1
+        disk.set(key, i, None)
+
+    assert disk.get("a") is None
+    assert disk.get("c") == (2, None)
@@ -0,0 +1,44 @@
+import pytest
+from llama_index.core.schema import TextNode
+
+from src import extraction
+from src.extraction import extract_triplets_concurrently
+from src.fakes import FakeLLM
+from src.prompts import CUSTOM_KG_TRIPLET_EXTRACT_TMPL
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(extraction, "RETRY_BASE_DELAY", 0.0)
+
+
+def _nodes(count):
+    return [TextNode(id_=f"book-{i}", text=f"BOOK TITLE: 书{i}\nSUMMARY:\n内容{i}") for i in range(count)]
+
+
+def test_results_follow_input_order():
+    llm = FakeLLM(delay=0)
+    results, stats = extract_triplets_concurrently(_nodes(30), CUSTOM_KG_TRIPLET_EXTRACT_TMPL, llm=llm, max_concurrency=8)
+
+    assert [triplets[0][0] for triplets in results] == [f"书{i}" for i in range(30)]
+    assert stats["failed"] == 0 and stats["retries"] == 0
+    assert llm.calls == 30
+
+
+def test_failed_requests_are_retried():
+    llm = FakeLLM(delay=0, fail_every=3)
+    results, stats = extract_triplets_concurrently(_nodes(30), CUSTOM_KG_TRIPLET_EXTRACT_TMPL, llm=llm, max_concurrency=4)
+
+    assert [triplets[0][0] for triplets in results] == [f"书{i}" for i in range(30)]
+    assert stats["failed"] == 0
+    assert stats["retries"] == llm.calls // 3
+    assert llm.calls == 30 + stats["retries"]
+
+
+def test_chunk_is_given_up_after_max_retries():
+    llm = FakeLLM(delay=0, fail_every=1)
+    results, stats = extract_triplets_concurrently(_nodes(5), CUSTOM_KG_TRIPLET_EXTRACT_TMPL, llm=llm, max_retries=2)
+
+    assert results == [None] * 5
+    assert stats["failed"] == 5
+    assert llm.calls == 5 * 3
@@ -0,0 +1,49 @@
+import random
+
+import pytest
+from llama_index.core.graph_stores import SimpleGraphStore
+
+from src.graph_store import CompactGraphStore
+
+
+def _random_graph(seed, entities=40, edges=200):
+    rng = random.Random(seed)
+    names = [f"实体{i}" for i in range(entities)]
+    graph_dict = {}
+    for _ in range(edges):
+        subj, obj = rng.choice(names), rng.choice(names)
+        pair = [rng.choice(["属于", "介绍", "包含"]), obj]
+        if pair not in graph_dict.setdefault(subj, []):
+            graph_dict[subj].append(pair)
+    return graph_dict
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+@pytest.mark.parametrize("depth,limit", [(1, 30), (2, 30), (2, 5), (3, 100)])
+def test_get_rel_map_matches_simple_graph_store(seed, depth, limit):
+    graph_dict = _random_graph(seed)
+    simple = SimpleGraphStore.from_dict({"graph_dict": graph_dict})
+    compact = CompactGraphStore.from_graph_dict(graph_dict)
+
+    subjs = ["实体0", "实体7", "实体13", "不存在"]
+    assert compact.get_rel_map(subjs, depth=depth, limit=limit) == \
+        simple.get_rel_map(subjs, depth=depth, limit=limit)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    graph_dict = _random_graph(3)
+    CompactGraphStore.from_graph_dict(graph_dict).save(str(tmp_path))
+    loaded = CompactGraphStore.from_persist_dir(str(tmp_path))
+
+    assert loaded.to_graph_dict() == CompactGraphStore.from_graph_dict(graph_dict).to_graph_dict()
+    for subj, edges in graph_dict.items():
+        assert sorted(loaded.get(subj)) == sorted(edges)
+
+
+def test_save_keeps_mapped_readers_valid(tmp_path):
+    CompactGraphStore.from_graph_dict({"甲": [["属于", "乙"]]}).save(str(tmp_path))
+    reader = CompactGraphStore.from_persist_dir(str(tmp_path))
+    CompactGraphStore.from_graph_dict({"丙": [["属于", "丁"]]}).save(str(tmp_path))
+
+    assert reader.get("甲") == [["属于", "乙"]]
+    assert CompactGraphStore.from_persist_dir(str(tmp_path)).get("丙") == [["属于", "丁"]]
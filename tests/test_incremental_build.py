@@ -0,0 +1,57 @@
+import json
+import os
+
+from llama_index.core.graph_stores import SimpleGraphStore
+
+from src.graph_store import CompactGraphStore
+from src.manifest import BuildManifest
+
+
+def _books(ids):
+    return {f"{i:04d}": (f"测试之书{i}", f"本书讲述了第{i}个主题。") for i in ids}
+
+
+def _subjects(persist_dir):
+    return set(SimpleGraphStore.from_persist_dir(persist_dir).to_dict()["graph_dict"])
+
+
+def test_only_new_and_changed_books_are_extracted(build_index, fake_models):
+    llm, _ = fake_models
+    books = _books(range(1, 11))
+    persist_dir = build_index(books, batch_size=4)
+    assert llm.calls == 10
+    assert len(BuildManifest.load(persist_dir)) == 10
+
+    # Unchanged catalog: nothing to extract
+    build_index(books)
+    assert llm.calls == 10
+
+    # 1 changed, 1 deleted, 2 added
+    books["0001"] = ("测试之书1（第二版）", "修订后的内容。")
+    del books["0002"]
+    books.update(_books([11, 12]))
+    build_index(books)
+    assert llm.calls == 10 + 3
+
+    manifest = BuildManifest.load(persist_dir)
+    assert set(manifest.documents) == {f"book-{book_id}" for book_id in books}
+    subjects = _subjects(persist_dir)
+    assert "测试之书2" not in subjects
+    assert "测试之书1" not in subjects
+    assert {"测试之书1（第二版）", "测试之书11", "测试之书12"} <= subjects
+
+    compact = CompactGraphStore.from_persist_dir(persist_dir)
+    assert compact.get("测试之书2") == []
+    assert ["属于", "图书"] in compact.get("测试之书11")
+
+
+def test_changed_refine_inputs_rebuild_query_stores(build_index, fake_models):
+    llm, _ = fake_models
+    persist_dir = build_index(_books(range(1, 6)), max_degree=50)
+    build_index(_books(range(1, 6)), max_degree=1)
+
+    assert llm.calls == 5
+    compact = CompactGraphStore.from_persist_dir(persist_dir)
+    assert max(compact.degree(f"测试之书{i}") for i in range(1, 6)) == 1
+    with open(os.path.join(persist_dir, "graph_refine.json"), encoding="utf-8") as f:
+        assert json.load(f)["max_degree"] == 1
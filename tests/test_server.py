@@ -0,0 +1,93 @@
+import json
+import socket
+import asyncio
+
+import pytest
+
+pytest.importorskip("llama_index.embeddings.huggingface")
+
+import query  # noqa: E402
+from server import QueryServer  # noqa: E402
+
+
+@pytest.fixture
+def query_engine(build_index, monkeypatch):
+    books = {f"{i:04d}": (f"历史之书{i}", f"本书讲述了历史上的第{i}个故事。") for i in range(1, 6)}
+    monkeypatch.setattr(query, "PERSIST_DIR", build_index(books))
+    monkeypatch.setattr(query, "QUERY_CACHE_PATH", None)
+    return query.load_query_engine(streaming=True, verbose=False)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _post(port, payload):
+    """Returns (status, headers, body) of one POST /query, with chunked bodies decoded."""
+    for _ in range(100):
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            break
+        except OSError:
+            await asyncio.sleep(0.01)
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(f"POST /query HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        chunks = []
+        while (size := int(await reader.readline(), 16)):
+            chunks.append((await reader.readexactly(size + 2))[:-2].decode("utf-8"))
+        writer.close()
+        return status, headers, chunks
+    content = await reader.readexactly(int(headers["content-length"]))
+    writer.close()
+    return status, headers, json.loads(content)
+
+
+def _run(server, payload):
+    port = _free_port()
+
+    async def main():
+        serving = asyncio.ensure_future(server.serve("127.0.0.1", port))
+        try:
+            return await _post(port, payload)
+        finally:
+            serving.cancel()
+
+    return asyncio.run(main())
+
+
+def test_answer_is_streamed_in_chunks(query_engine, fake_models):
+    server = QueryServer(query_engine, fake_models[1])
+    status, headers, chunks = _run(server, {"query": "推荐一些关于历史之书1的书籍", "stream": True})
+
+    assert status == 200
+    assert headers["content-type"].startswith("text/plain")
+    assert len(chunks) > 1
+    assert "历史之书1" in "".join(chunks)
+    assert server.served == 1
+
+
+def test_json_answer_without_streaming(query_engine, fake_models):
+    server = QueryServer(query_engine, fake_models[1])
+    status, _, payload = _run(server, {"query": "推荐一些关于历史之书2的书籍", "stream": False})
+
+    assert status == 200
+    assert "历史之书2" in payload["response"]
+
+
+def test_rejects_queries_beyond_max_in_flight(query_engine, fake_models):
+    server = QueryServer(query_engine, fake_models[1], max_in_flight=0)
+    status, _, payload = _run(server, {"query": "推荐一些关于历史的书籍"})
+
+    assert status == 503
+    assert "error" in payload
+    assert server.rejected == 1 and server.served == 0
@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from src.vector_index import VectorIndex, saved_dtype
+
+DIM = 64
+
+
+@pytest.fixture
+def embeddings():
+    rng = np.random.default_rng(0)
+    return rng.standard_normal((500, DIM)).astype(np.float32)
+
+
+def _exact_top_k(embeddings, query, k):
+    normed = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return list(np.argsort(-(normed @ (query / np.linalg.norm(query))))[:k])
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_top_k_matches_exact_search(embeddings, dtype):
+    ids = [f"t{i}" for i in range(len(embeddings))]
+    index = VectorIndex.from_embeddings(ids, embeddings, dtype=dtype)
+    queries = embeddings[:20] + 0.1 * np.random.default_rng(1).standard_normal((20, DIM))
+
+    for query, hits in zip(queries, index.search(queries, top_k=5)):
+        expected = [ids[i] for i in _exact_top_k(embeddings, query, 5)]
+        assert hits[0][0] == expected[0]
+        assert len({hit_id for hit_id, _ in hits} & set(expected)) >= 4
+        scores = [score for _, score in hits]
+        assert scores == sorted(scores, reverse=True)
+
+
+@pytest.mark.parametrize("dtype", ["float32", "float16", "int8"])
+def test_save_and_load_round_trip(tmp_path, embeddings, dtype):
+    ids = [f"t{i}" for i in range(len(embeddings))]
+    index = VectorIndex.from_embeddings(ids, embeddings, dtype=dtype)
+    index.save(str(tmp_path))
+    loaded = VectorIndex.load(str(tmp_path))
+
+    assert saved_dtype(str(tmp_path)) == dtype
+    assert loaded.search(embeddings[3], top_k=3) == index.search(embeddings[3], top_k=3)
+
+
+def test_single_query_and_small_index():
+    index = VectorIndex.from_embeddings(["a", "b"], np.eye(2, DIM, dtype=np.float32))
+
+    hits = index.search(np.eye(1, DIM, dtype=np.float32)[0], top_k=5)
+    assert [hit_id for hit_id, _ in hits] == ["a", "b"]
+    assert hits[0][1] == pytest.approx(1.0)
+    assert VectorIndex.from_embeddings([], np.zeros((0, DIM))).search(np.ones(DIM)) == []